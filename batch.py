@@ -0,0 +1,113 @@
+"""renders MHD logs to image files without a display, several at a time
+
+    python batch.py "logs/*.txt" --signals jitter drop_diam --start 10:00 --end 14:30 --format svg --out charts
+
+Each log goes through the same LogModel / LogPlotter code the GUI uses, on matplotlib's Agg backend."""
+import os
+import glob
+import argparse
+import traceback
+from datetime import datetime, time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import ingest
+from logmodel import LogModel
+from plotter import LogPlotter, special_plots
+
+
+def expand(patterns):
+    # the Windows shell doesn't expand wildcards, so do it here; names without any are kept as they are
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        filenames += [match for match in matches if match not in filenames]
+    return filenames
+
+
+def parse_when(text, day):
+    # '2018-07-03 10:00[:00]' or just '10:00[:00]', which means that time on the log's first day
+    if text is None:
+        return None
+    try:
+        return datetime.combine(day, time.fromisoformat(text))
+    except ValueError:
+        return datetime.fromisoformat(text)
+
+
+def one_process_each():
+    # the logs are already spread over the pool, so each is parsed in just its own process
+    ingest.parallel_threshold = float('inf')
+
+
+def render(filename, options):
+    # one log -> one image file; returns (filename, output filename or None, message)
+    try:
+        model = LogModel()
+        date_range = model.load(filename)
+        if not len(model.log_data) or date_range is None:
+            return filename, None, 'no timestamped rows'
+        # the GUI's default range is from the start of the log to the end of that day
+        min_date_time = parse_when(options.start, date_range[0].date()) or date_range[0]
+        max_date_time = parse_when(options.end, date_range[0].date()) or date_range[1]
+        desired_plots = [plot for plot in options.signals if plot in model.signal_keys]  # what the GUI could pick
+        if not desired_plots:
+            return filename, None, 'none of the signals are in this log'
+
+        special_plots['Selected Events'] = options.events
+        plot_data, plot_rows = model.generate_plot_data(desired_plots, min_date_time, max_date_time,
+                                                        options.skip_no_data, options.skip_no_jetting)
+        if not len(plot_rows):
+            return filename, None, 'nothing to plot in that time range'
+
+        figure = Figure(figsize=options.size, dpi=options.dpi)
+        FigureCanvasAgg(figure)
+        plotter = LogPlotter(figure, interactive=False)
+        plotter.plot(model.log_data, plot_data, plot_rows, desired_plots, not options.index_axis, model.info,
+                     events=model.events)
+        name = os.path.splitext(os.path.basename(filename))[0] + '.' + options.format
+        output = os.path.join(options.out or os.path.dirname(os.path.abspath(filename)), name)
+        figure.savefig(output, format=options.format)
+        return filename, output, '%d rows' % len(plot_rows)
+    except Exception:
+        return filename, None, traceback.format_exc()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render MHD logs to image files without a display.')
+    parser.add_argument('logs', nargs='+', help='log files or wildcard patterns')
+    parser.add_argument('--signals', nargs='+', required=True, help='signals to plot, one lane each')
+    parser.add_argument('--events', nargs='*', default=[], help="event types for the 'Selected Events' lane")
+    parser.add_argument('--start', help="'YYYY-mm-dd HH:MM[:SS]', or a time on the log's first day "
+                                        "(default: the start of the log)")
+    parser.add_argument('--end', help='the same; default: the end of the first day, as in the GUI')
+    parser.add_argument('--skip-no-data', action='store_true')
+    parser.add_argument('--skip-no-jetting', action='store_true')
+    parser.add_argument('--index-axis', action='store_true', help='x-axis by log entry instead of time')
+    parser.add_argument('--format', choices=['png', 'svg', 'pdf'], default='png')
+    parser.add_argument('--out', help='output directory (default: next to each log)')
+    parser.add_argument('--size', type=float, nargs=2, default=[16, 10], metavar=('WIDTH', 'HEIGHT'),
+                        help='inches')
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None, help='default: one per CPU')
+    options = parser.parse_args()
+
+    filenames = expand(options.logs)
+    if options.out:
+        os.makedirs(options.out, exist_ok=True)
+    failures = 0
+    with ProcessPoolExecutor(max_workers=options.processes, initializer=one_process_each) as executor:
+        for filename, output, message in executor.map(render, filenames, [options] * len(filenames)):
+            if output:
+                print('%s -> %s (%s)' % (filename, output, message))
+            else:
+                failures += 1
+                print('%s: skipped, %s' % (filename, message))
+    print('%d of %d logs rendered' % (len(filenames) - failures, len(filenames)))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,239 @@
+"""headless benchmarks for reading, indexing and plotting both log formats
+
+    python benchmark.py                          # 10^4 .. 10^6 rows
+    python benchmark.py --sizes 100000000 --only loader.parse_file detect_runs
+
+Logs are generated deterministically into --data (and reused), and each run appends its timings,
+throughput and peak memory to --output so results can be compared between commits."""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from time import perf_counter
+from datetime import datetime, timedelta
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from logtail import LogTail
+from logmodel import LogModel
+from plotter import LogPlotter
+import loader
+import daqarchive
+
+
+default_sizes = [10**4, 10**5, 10**6]
+chunk_rows = 100000  # rows generated at a time
+# the signals the MHD generator uses first, so plots look like real ones
+mhd_signals = ['odo', 'drop_count', 'jet_on', 'jet_freq', 'average_speed', 'fdRatio', 'jitter', 'stream_angle',
+               'pw_pos', 'pw_neg', 'front_angle', 'side_angle', 'nozzle_temp', 'reservoir_temp']
+mhd_events = ['Triggered camera, filename: %s', 'Nozzle purge', 'Clog', 'Completed cycle %d', 'Starting torture test']
+plot_signals = ['jitter', 'fdRatio', 'average_speed', 'drop_diam']
+
+
+def write_mhd_log(filename, rows, keys=10, event_rate=0.01, comment_rate=0.001, twelve_hour_rate=0.0, seed=0):
+    # JSON lines with a header line, keys numeric signals per row, 1 Hz timestamps starting 2018-07-03 08:00.
+    # twelve_hour_rate is the fraction of rows using '%I:%M:%S %p' instead of '%H:%M:%S'
+    rng = np.random.default_rng(seed)
+    names = (mhd_signals + ['signal_%d' % num for num in range(keys)])[:max(keys, 2)]
+    start = datetime(2018, 7, 3, 8)
+    with open(filename, 'w') as log_file:
+        log_file.write(json.dumps({'nozzle': 'N1', 'material': 'Al', 'operator': 'bench', 'goal': 'speed'}) + '\n')
+        for first in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - first)
+            values = rng.random((count, len(names))) * 100
+            events = rng.random(count)
+            twelve_hour = rng.random(count) < twelve_hour_rate
+            lines = []
+            for num in range(count):
+                row = first + num
+                moment = start + timedelta(seconds=row)
+                record = {'date': moment.strftime('%Y%m%d'),
+                          'time': moment.strftime('%I:%M:%S %p' if twelve_hour[num] else '%H:%M:%S')}
+                record.update(zip(names, values[num].round(3).tolist()))
+                record['odo'] = row
+                if 'jet_on' in record:
+                    record['jet_on'] = int(record['jet_on'] < 80)
+                if events[num] < comment_rate:
+                    record['event'] = 'Comment: note %d' % row
+                elif events[num] < comment_rate + event_rate:
+                    event = mhd_events[row % len(mhd_events)]
+                    record['event'] = event % row if '%' in event else event
+                lines.append(json.dumps(record))
+            log_file.write('\n'.join(lines) + '\n')
+
+
+def write_daq_log(filename, rows, channels=8, toggle_rate=0.01, seed=0):
+    # 'YYYY-mm-dd HH:MM:SS [bits]' lines at 1 Hz; each channel flips with probability toggle_rate per row
+    rng = np.random.default_rng(seed)
+    start = datetime(2020, 1, 1)
+    state = np.zeros(channels, dtype=np.int8)
+    with open(filename, 'w') as log_file:
+        for first in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - first)
+            flips = rng.random((count, channels)) < toggle_rate
+            bits = (np.cumsum(flips, axis=0) + state) % 2
+            state = bits[-1]
+            lines = ['%s [%s]' % ((start + timedelta(seconds=first + num)).strftime('%Y-%m-%d %H:%M:%S'),
+                                  ','.join(map(str, bits[num].tolist()))) for num in range(count)]
+            log_file.write('\n'.join(lines) + '\n')
+
+
+def generated(data_dir, kind, rows, **options):
+    # the path of a generated log, writing it first if it isn't there yet
+    name = '%s_%d%s.log' % (kind, rows, ''.join('_%s%s' % item for item in sorted(options.items())))
+    filename = os.path.join(data_dir, name)
+    if not os.path.exists(filename):
+        print('Generating %s...' % filename)
+        os.makedirs(data_dir, exist_ok=True)
+        (write_mhd_log if kind == 'mhd' else write_daq_log)(filename + '.tmp', rows, **options)
+        os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def fresh_model(filename):
+    # parses the log without the help of a cache left by an earlier run
+    shutil.rmtree(filename + '.cache', ignore_errors=True)
+    model = LogModel()
+    model.process_file(filename)
+    return model
+
+
+def loaded_model(filename):
+    model = LogModel()
+    model.load(filename)
+    return model
+
+
+def plot_data(model):
+    return model.generate_plot_data(plot_signals, datetime(2000, 1, 1), datetime(2100, 1, 1))
+
+
+def format_ticks(plotter, ticks):
+    for tick in ticks:
+        plotter.format_fn(tick, 0)
+
+
+def setup_plotter(filename):
+    model = loaded_model(filename)
+    data, rows = plot_data(model)
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    plotter = LogPlotter(figure, interactive=False)
+    plotter.plot(model.log_data, data, rows, plot_signals[:1], True, model.info, events=model.events)
+    times = data['time'][~np.isnan(data['time'])]
+    return plotter, np.linspace(times.min(), times.max(), 10000)
+
+
+def daq_arrays(filename):
+    return loader.log_arrays(loader.parse_file(filename))
+
+
+def fresh_archive(filename):
+    # packs the log without the help of an archive left by an earlier run
+    if os.path.exists(filename + '.daq'):
+        os.remove(filename + '.daq')
+    return daqarchive.convert(filename)
+
+
+def stream_runs(filename):
+    detector = loader.RunDetector()
+    return sum(1 for _ in detector.runs(loader.read_records(filename)))
+
+
+def cases(mhd_file, daq_file):
+    # (name, log, function, setup) -- setup's result is passed to function and isn't timed
+    return [
+        ('read_file_by_line', mhd_file, lambda: LogTail(mhd_file).read_new(), None),
+        ('process_file', mhd_file, lambda: fresh_model(mhd_file), None),
+        ('process_file (cached)', mhd_file, lambda cached: LogModel().process_file(mhd_file),
+         lambda: loaded_model(mhd_file)),
+        ('generate_plot_data', mhd_file, plot_data, lambda: loaded_model(mhd_file)),
+        ('format_fn', mhd_file, lambda setup: format_ticks(*setup), lambda: setup_plotter(mhd_file)),
+        ('loader.parse_file', daq_file, lambda: loader.parse_file(daq_file), None),
+        ('detect_runs', daq_file, lambda arrays: loader.detect_runs(*arrays), lambda: daq_arrays(daq_file)),
+        ('RunDetector', daq_file, lambda: stream_runs(daq_file), None),
+        ('DaqArchive.convert', daq_file, lambda: fresh_archive(daq_file), None),
+        ('detect_runs (archive)', daq_file, lambda archive: loader.detect_runs(*archive.arrays()),
+         lambda: daqarchive.convert(daq_file)),
+    ]
+
+
+def measure(function, setup, repeat):
+    # best wall time of repeat runs, then one more under tracemalloc for the peak memory
+    argument = setup() if setup else None
+    call = (lambda: function(argument)) if setup else function
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        call()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the log readers headlessly.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='rows per generated log')
+    parser.add_argument('--only', nargs='+', help='names of the benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark (the best is kept)')
+    parser.add_argument('--keys', type=int, default=10, help='numeric signals per MHD row')
+    parser.add_argument('--event-rate', type=float, default=0.01)
+    parser.add_argument('--comment-rate', type=float, default=0.001)
+    parser.add_argument('--twelve-hour-rate', type=float, default=0.0, help='fraction of AM/PM timestamps')
+    parser.add_argument('--data', default='bench_data', help='where generated logs are kept')
+    parser.add_argument('--output', default='benchmark_results.json', help='results are appended here')
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.sizes:
+        mhd_file = generated(args.data, 'mhd', rows, keys=args.keys, event_rate=args.event_rate,
+                             comment_rate=args.comment_rate, twelve_hour_rate=args.twelve_hour_rate)
+        daq_file = generated(args.data, 'daq', rows)
+        for name, filename, function, setup in cases(mhd_file, daq_file):
+            if args.only and name not in args.only:
+                continue
+            seconds, peak = measure(function, setup, args.repeat)
+            size = os.path.getsize(filename)
+            result = {'benchmark': name, 'rows': rows, 'bytes': size, 'seconds': seconds,
+                      'rows_per_second': rows / seconds if seconds else None,
+                      'mb_per_second': size / 2**20 / seconds if seconds else None, 'peak_bytes': peak}
+            results.append(result)
+            print('%-22s %11d rows  %9.3f s  %12.0f rows/s  %8.1f MB/s  %8.1f MB peak' %
+                  (name, rows, seconds, result['rows_per_second'] or 0, result['mb_per_second'] or 0, peak / 2**20))
+
+    try:
+        with open(args.output, 'r') as results_file:
+            history = json.load(results_file)
+    except (OSError, ValueError):
+        history = []
+    history.append({'commit': commit(), 'date': datetime.now().isoformat(timespec='seconds'),
+                    'python': sys.version.split()[0], 'machine': platform.platform(),
+                    'options': {key: value for key, value in vars(args).items() if key not in ('data', 'output')},
+                    'results': results})
+    with open(args.output, 'w') as results_file:
+        json.dump(history, results_file, indent=1)
+    print('Results appended to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""FurnaceDAQ samples packed into a binary archive (<log>.daq): int64 epoch seconds and a bitmask per sample
+
+    python daqarchive.py FurnaceDAQ.log [archive]    # converts the log, or adds what was appended since last time
+
+The archive is a fixed-size header (magic, then JSON: the channel names, how many records are committed, and how
+far into the log the conversion got) followed by the records. Records are only ever appended, and the header is
+rewritten after them, so an interrupted append leaves the archive as it was. Reads are a memory map, so opening a
+year of 1 Hz samples (about 280 MB) doesn't read it."""
+import os
+import sys
+import json
+import numpy as np
+from loader import channel_names, channel_states, log_arrays, parse_range
+from ingest import map_ranges, last_line_end, ParseErrors
+from logfile import log_size
+
+
+archive_magic = b'FDAQPACK'
+archive_version = 1
+header_size = 4096
+mask_types = [np.uint8, np.uint16, np.uint32, np.uint64]  # the smallest that has a bit per channel is used
+
+
+def mask_type(n_channels):
+    for dtype in mask_types:
+        if n_channels <= 8 * np.dtype(dtype).itemsize:
+            return np.dtype(dtype)
+    raise ValueError('an archive can have at most 64 channels, not %d' % n_channels)
+
+
+def record_type(n_channels):
+    return np.dtype([('time', '<i8'), ('bits', mask_type(n_channels).newbyteorder('<'))])
+
+
+def pack(states):
+    # N x channels booleans -> a bitmask per row, bit n set while channel n is on
+    states = np.asarray(states, dtype=bool)
+    weights = np.left_shift(np.ones(states.shape[1], dtype=np.uint64), np.arange(states.shape[1], dtype=np.uint64))
+    return (states * weights).sum(axis=1, dtype=np.uint64).astype(mask_type(states.shape[1]))
+
+
+def unpack(bits, n_channels):
+    # bitmasks -> N x channels booleans
+    bits = np.asarray(bits).astype(np.uint64)
+    return (bits[:, None] >> np.arange(n_channels, dtype=np.uint64)) & 1 == 1
+
+
+class DaqArchive(object):
+    """a packed archive of one FurnaceDAQ log. records is a read-only memory map of the committed samples."""
+    def __init__(self, path, channel_names=channel_names):
+        self.path = path
+        self.channel_names = list(channel_names)
+        self.count = 0  # records committed
+        self.offset = 0  # byte offset in the log that conversion got to
+        self.state = None  # channel states after the last record, for log lines that leave some as they were
+        self.records = np.zeros(0, dtype=record_type(len(self.channel_names)))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def dtype(self):
+        return record_type(len(self.channel_names))
+
+    def load(self):
+        # reads the header and maps the records; False if there's no archive (or not one we can read)
+        try:
+            with open(self.path, 'rb') as archive_file:
+                head = archive_file.read(header_size)
+        except OSError:
+            return False
+        if len(head) < header_size or not head.startswith(archive_magic):
+            return False
+        try:
+            meta = json.loads(head[len(archive_magic):].decode('utf-8'))
+        except ValueError:
+            return False
+        if meta.get('version') != archive_version:
+            return False
+        self.channel_names = meta['channel_names']
+        self.count = meta['count']
+        self.offset = meta['offset']
+        self.state = meta['state']
+        self.map()
+        return True
+
+    def map(self):
+        if self.count:
+            self.records = np.memmap(self.path, dtype=self.dtype, mode='r', offset=header_size, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)  # (an empty file can't be mapped)
+
+    def write_header(self, archive_file):
+        meta = json.dumps({'version': archive_version, 'channel_names': self.channel_names, 'count': self.count,
+                           'offset': self.offset, 'state': self.state}).encode('utf-8')
+        if len(archive_magic) + len(meta) > header_size:
+            raise ValueError('too many channel names for the archive header')
+        archive_file.seek(0)
+        archive_file.write(archive_magic + meta.ljust(header_size - len(archive_magic)))
+
+    def create(self):
+        # starts an empty archive, replacing any that's there
+        self.count = self.offset = 0
+        self.state = None
+        with open(self.path + '.tmp', 'wb') as archive_file:
+            self.write_header(archive_file)
+        os.replace(self.path + '.tmp', self.path)
+        self.map()
+
+    def append(self, seconds, states, offset=None):
+        # adds samples (epoch seconds, N x channels booleans) after the committed ones. offset is how far into the
+        # log they go, for convert(). Anything past the committed records (an append that was interrupted) is
+        # dropped first.
+        seconds = np.asarray(seconds, dtype=np.int64)
+        records = np.zeros(len(seconds), dtype=self.dtype)
+        records['time'] = seconds
+        records['bits'] = pack(states) if len(seconds) else 0
+        self.records = None  # let go of the old map before the file changes under it
+        with open(self.path, 'r+b') as archive_file:
+            archive_file.truncate(header_size + self.count * self.dtype.itemsize)
+            archive_file.seek(0, os.SEEK_END)
+            records.tofile(archive_file)
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+            self.count += len(records)
+            if offset is not None:
+                self.offset = offset
+            if len(records):
+                self.state = np.asarray(states[-1], dtype=int).tolist()
+            self.write_header(archive_file)
+        self.map()
+
+    def times(self, start=0, stop=None):
+        return self.records['time'][start:stop].view('datetime64[s]')
+
+    def states(self, start=0, stop=None):
+        return unpack(self.records['bits'][start:stop], len(self.channel_names))
+
+    def arrays(self, start=0, stop=None):
+        # the same (datetime64 column, N x channels matrix) as loader.log_arrays, ready for detect_runs
+        return self.times(start, stop), self.states(start, stop)
+
+    def rows(self, t_min, t_max):
+        # (start, stop) of the records with t_min <= time <= t_max (datetime64 or epoch seconds); the log is
+        # written in time order, so it's a binary search of the mapped times
+        times = self.records['time']
+        t_min, t_max = [np.datetime64(t, 's').astype(np.int64) for t in (t_min, t_max)]
+        return int(np.searchsorted(times, t_min, side='left')), int(np.searchsorted(times, t_max, side='right'))
+
+
+def convert(log_filename, archive_filename=None, channel_names=channel_names):
+    # packs a FurnaceDAQ log into an archive, or appends to the archive whatever was added to the log since the
+    # last conversion. Returns the DaqArchive.
+    archive = DaqArchive(archive_filename or log_filename + '.daq', channel_names)
+    n_channels = len(archive.channel_names)
+    if not archive.load() or archive.offset > log_size(log_filename) or archive.channel_names != list(channel_names):
+        archive = DaqArchive(archive.path, channel_names)
+        archive.create()
+    end = last_line_end(log_filename)
+    if end <= archive.offset:
+        return archive
+    print('Packing %s into %s...' % (log_filename, archive.path))
+    state = archive.state
+    errors = ParseErrors()
+    for (part, part_errors), range_end, _ in map_ranges(parse_range, log_filename, archive.offset, end):
+        errors.merge(part_errors)
+        if part:
+            times, bits = log_arrays(part)
+            bits = bits[:, :n_channels]
+            if state is not None:  # so that a 'leave as it was' in the first line carries on from the last part
+                bits = np.concatenate([np.array([state], dtype=bits.dtype), bits])
+            states = channel_states(bits)[1 if state is not None else 0:]
+            state = states[-1].astype(int).tolist()
+            archive.append(times.astype(np.int64), states, range_end)
+        else:
+            archive.append([], np.zeros((0, n_channels), dtype=bool), range_end)
+    errors.report(log_filename)
+    print('%d records in %s' % (len(archive), archive.path))
+    return archive
+
+
+if __name__ == '__main__':
+    convert(*sys.argv[1:3])
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def first_per_bucket(indices, bucket):
+    # the first of the given indices in each bucket
+    return indices[np.unique(bucket[indices], return_index=True)[1]]
+
+
+def minmax_indices(x, y, buckets):
+    # peak-preserving downsample: for each of `buckets` equal-width slices of x, keep the samples with the smallest
+    # and largest y (so spikes and clogs stay visible) plus the first NaN (so gaps still break the line)
+    # x must be sorted. Returns sorted indices into x/y.
+    n = len(x)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    if x[-1] > x[0]:
+        edges = np.searchsorted(x, np.linspace(x[0], x[-1], buckets + 1)[:-1])
+    else:
+        edges = np.linspace(0, n, buckets, endpoint=False).astype(np.intp)
+    edges = np.unique(edges)  # empty buckets would break reduceat
+    bucket = np.repeat(np.arange(len(edges)), np.diff(np.append(edges, n)))
+
+    missing = np.isnan(y)
+    y_low = np.where(missing, np.inf, y)
+    y_high = np.where(missing, -np.inf, y)
+    mins = first_per_bucket(np.flatnonzero(y_low == np.minimum.reduceat(y_low, edges)[bucket]), bucket)
+    maxes = first_per_bucket(np.flatnonzero(y_high == np.maximum.reduceat(y_high, edges)[bucket]), bucket)
+    gaps = first_per_bucket(np.flatnonzero(missing), bucket)
+    return np.unique(np.concatenate([mins, maxes, gaps, [0, n - 1]]))
+
+
+class LevelOfDetail(object):
+    """keeps plotted lines decimated to about one min/max couple per pixel of their axis.
+    When an axis is zoomed or panned, only the visible window is re-decimated, so zooming in
+    far enough shows every sample."""
+    def __init__(self):
+        self.lines = {}  # axis -> {Line2D: (x, y)}
+
+    def add(self, axis, line, x, y):
+        # x, y are the full data; the line is (re)drawn with the decimated version
+        # adding a line that's already here replaces its data
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) > 1 and np.any(np.diff(x) < 0):
+            order = np.argsort(x, kind='stable')  # bucketing needs sorted x
+            x, y = x[order], y[order]
+        if axis not in self.lines:
+            self.lines[axis] = {}
+            axis.callbacks.connect('xlim_changed', self.on_xlim_changed)
+        self.lines[axis][line] = (x, y)
+        self.update_line(axis, line, x, y)
+
+    def update_line(self, axis, line, x, y, x_limits=None):
+        pixels = max(int(axis.bbox.width), 100)
+        if x_limits is None or not len(x):
+            start, stop = 0, len(x)
+        else:
+            start = max(0, np.searchsorted(x, x_limits[0]) - 1)  # one sample past each edge so the line reaches it
+            stop = min(len(x), np.searchsorted(x, x_limits[1], side='right') + 1)
+        keep = minmax_indices(x[start:stop], y[start:stop], pixels) + start
+        line.set_data(x[keep], y[keep])
+
+    def on_xlim_changed(self, axis):
+        x_limits = sorted(axis.get_xlim())
+        for line, (x, y) in self.lines.get(axis, {}).items():
+            self.update_line(axis, line, x, y, x_limits)
+
+    def update_all(self):
+        # e.g. after a resize changes how many pixels each axis has
+        for axis in self.lines:
+            self.on_xlim_changed(axis)
@@ -0,0 +1,67 @@
+import math
+import numpy as np
+
+
+class Derived(object):
+    """a signal calculated from others: the keys it needs and a formula over their columns (whole arrays, so
+    it's vectorized). rows_before is how many earlier rows the formula looks back over, so that rows appended
+    later can be calculated from just the end of the columns."""
+    def __init__(self, name, inputs, formula, rows_before=0):
+        self.name = name
+        self.inputs = inputs
+        self.formula = formula
+        self.rows_before = rows_before
+
+
+derived_signals = {}  # name -> Derived, in the order they're offered
+
+
+def register(name, inputs, rows_before=0):
+    # decorator for a formula: @register('name', ['input', ...])
+    def add(formula):
+        derived_signals[name] = Derived(name, inputs, formula, rows_before)
+        return formula
+    return add
+
+
+def available(keys):
+    # the derived signals that can be calculated from a log with these keys (a log's own signal of the
+    # same name wins)
+    return [name for name, signal in derived_signals.items()
+            if name not in keys and all(key in keys for key in signal.inputs)]
+
+
+def derive(store, name):
+    # the column of a derived signal, calculated for whichever rows of the store it hasn't been yet
+    signal = derived_signals[name]
+    done = store.derived.get(name, 0)
+    if done < len(store):
+        start = max(0, done - signal.rows_before)
+        inputs = [store.column(key) for key in signal.inputs]
+        inputs = [column[start:] if column is not None else np.full(len(store) - start, np.nan) for column in inputs]
+        store.set_column(name, signal.formula(*inputs)[done - start:], done)
+        store.derived[name] = len(store)
+    return store.column(name)
+
+
+@register('drop_diam', ['fdRatio'])
+def diam_from_volume(drop_volume_nl):
+    """returns drop diameter in microns given drop volume in nL"""
+    drop_volume_mm3 = drop_volume_nl / 1000
+    drop_diam_um = np.round(1000 * ((drop_volume_mm3/(4/3*math.pi))**(1/3))*2)  # x1000 for microns
+    return drop_diam_um
+
+
+jitter_rows = 10
+
+
+@register('jitter_avg', ['jitter'], rows_before=jitter_rows - 1)
+def rolling_jitter(jitter):
+    # mean of the jitter samples in the last jitter_rows rows, on the rows that have one
+    valid = ~np.isnan(jitter)
+    sums = np.concatenate([[0], np.cumsum(np.where(valid, jitter, 0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    ends = np.arange(1, len(jitter) + 1)
+    starts = np.maximum(ends - jitter_rows, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, (sums[ends] - sums[starts]) / (counts[ends] - counts[starts]), np.nan)
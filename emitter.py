@@ -0,0 +1,121 @@
+"""a stand-in for the MHD logger, for trying out live ingest: sends log lines to a viewer's live feed
+
+    python emitter.py                                  # made-up rows to localhost:5555, one a second
+    python emitter.py --rate 20 --log live.txt         # also appends them to a file, as the logger does
+    python emitter.py --replay old.txt --rate 100      # the lines of an existing log (or a FurnaceDAQ log)
+    python emitter.py --address udp://localhost:5555   # or a Unix socket path
+
+A TCP or Unix socket connection is made again if the viewer goes away, and lines sent while it's down are lost
+(the file is the durable record)."""
+import json
+import time
+import socket
+import argparse
+from datetime import datetime
+import numpy as np
+from liveingest import default_address, parse_address
+
+
+events = ['Triggered camera, filename: %s', 'Nozzle purge', 'Clog', 'Completed cycle %d']
+
+
+def made_up_lines(seed=0):
+    # an endless run of JSON lines that look like an MHD log: a header, then drifting signals and some events
+    rng = np.random.default_rng(seed)
+    yield json.dumps({'nozzle': 'N1', 'material': 'Al', 'operator': 'emitter', 'goal': 'live test'})
+    speed, freq, ratio, odo = 2.0, 5000.0, 1.0, 0
+    while True:
+        now = datetime.now()
+        speed = max(0.0, speed + rng.normal(0, 0.02))
+        freq = max(0.0, freq + rng.normal(0, 10))
+        ratio = max(0.0, ratio + rng.normal(0, 0.01))
+        odo += 1
+        record = {'date': now.strftime('%Y%m%d'), 'time': now.strftime('%H:%M:%S'), 'odo': odo,
+                  'drop_count': odo * 100, 'jet_on': 1, 'average_speed': round(speed, 3), 'jet_freq': round(freq),
+                  'fdRatio': round(ratio, 3), 'jitter': round(abs(rng.normal(0, 1)), 3)}
+        chance = rng.random()
+        if chance < 0.002:
+            record['event'] = 'Comment: emitted at %s' % now.strftime('%H:%M:%S')
+        elif chance < 0.02:
+            event = events[odo % len(events)]
+            if 'filename' in event:
+                event = event % now.strftime('%Y%m%d-%H%M%S')
+            elif '%' in event:
+                event = event % odo
+            record['event'] = event
+        yield json.dumps(record)
+
+
+def replayed_lines(filename):
+    with open(filename, 'r') as log_file:
+        for line in log_file:
+            if line.strip():
+                yield line.rstrip('\n')
+
+
+class Sender(object):
+    def __init__(self, address):
+        self.kind, self.address = parse_address(address)
+        self.sock = None
+
+    def send(self, line):
+        data = (line + '\n').encode('utf-8')
+        try:
+            if self.sock is None:
+                family = socket.AF_UNIX if self.kind == 'unix' else socket.AF_INET
+                self.sock = socket.socket(family, socket.SOCK_DGRAM if self.kind == 'udp' else socket.SOCK_STREAM)
+                if self.kind != 'udp':
+                    self.sock.connect(self.address)
+            if self.kind == 'udp':
+                self.sock.sendto(data, self.address)
+            else:
+                self.sock.sendall(data)
+            return True
+        except OSError:
+            self.close()  # try again with the next line
+            return False
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send log lines to a live feed.')
+    parser.add_argument('--address', default=default_address, help="'host:port', 'udp://host:port' or a path")
+    parser.add_argument('--rate', type=float, default=1.0, help='lines a second')
+    parser.add_argument('--replay', help='a log to send the lines of, instead of made-up ones')
+    parser.add_argument('--log', help='a file to append the lines to as well')
+    parser.add_argument('--count', type=int, help='stop after this many lines')
+    args = parser.parse_args()
+
+    lines = replayed_lines(args.replay) if args.replay else made_up_lines()
+    sender = Sender(args.address)
+    log_file = open(args.log, 'a') if args.log else None
+    sent = lost = 0
+    next_time = time.monotonic()
+    try:
+        for num, line in enumerate(lines):
+            if args.count is not None and num >= args.count:
+                break
+            if log_file is not None:
+                log_file.write(line + '\n')
+                log_file.flush()
+            if sender.send(line):
+                sent += 1
+            else:
+                lost += 1
+            next_time += 1 / args.rate
+            time.sleep(max(0.0, next_time - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sender.close()
+        if log_file is not None:
+            log_file.close()
+    print('%d lines sent, %d lost' % (sent, lost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+no_rows = np.zeros(0, dtype=np.int64)
+
+
+class EventIndex(object):
+    """the rows of a log that have an event, by event type (row numbers ascending, with their times), and the
+    rows of its comments in the order they were read, so a comment's number in the list doesn't change as rows
+    are appended. Kept up to date as rows are read, so lanes and lists only look at the events."""
+    def __init__(self):
+        self.length = 0  # rows of the store indexed so far
+        self.rows = {}  # event_type code -> row numbers
+        self.times = {}  # event_type code -> their times
+        self.comment_rows = no_rows  # comment number -> row
+
+    def update(self, store, comment_codes):
+        # indexes the rows added to store since the last update (their event_type codes must be set already);
+        # comment_codes are the event codes that are comments. Returns the event_type codes of the new events
+        # that aren't comments.
+        event_codes = store.category_column('event')[self.length:]
+        new_rows = np.flatnonzero(event_codes >= 0)
+        comments = np.isin(event_codes[new_rows], comment_codes)
+        self.comment_rows = np.concatenate([self.comment_rows, new_rows[comments] + self.length])
+        types = store.category_column('event_type')[self.length:][new_rows]
+        new_rows += self.length
+        for code in np.unique(types).tolist():
+            mine = new_rows[types == code]
+            self.rows[code] = np.concatenate([self.rows.get(code, no_rows), mine])
+            self.times[code] = np.concatenate([self.times.get(code, np.zeros(0)), store.time[mine]])
+        self.length = len(store)
+        return np.unique(types[~comments]).tolist()
+
+    def rows_of(self, type_codes):
+        # row numbers of the events of any of these types, ascending
+        parts = [self.rows[code] for code in type_codes if code in self.rows]
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts)) if parts else no_rows
+
+    def positions_in(self, type_codes, rows):
+        # where the events of these types are in rows (ascending row numbers, e.g. the rows being plotted)
+        if not len(rows):
+            return no_rows
+        events = self.rows_of(type_codes)
+        events = events[np.searchsorted(events, rows[0]):np.searchsorted(events, rows[-1], side='right')]
+        positions = np.searchsorted(rows, events)
+        return positions[rows[positions] == events]
+
+    @classmethod
+    def of(cls, store):
+        # an index of a whole store, for when there isn't one already
+        index = cls()
+        index.update(store, [])
+        return index
@@ -0,0 +1,219 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from signalstore import SignalStore
+from instrument import span
+from logfile import open_log, log_size, compression, cheap_seeks, stream, scanned, scan
+
+try:
+    import orjson  # optional, several times faster than the standard library
+    fast_loads = orjson.loads
+except ImportError:
+    fast_loads = json.loads
+
+
+parallel_threshold = 16 * 2**20  # files smaller than this aren't worth starting processes for
+min_chunk_size = 4 * 2**20
+
+
+class Cancelled(Exception):
+    """raised inside a load when its cancel event is set"""
+
+
+class ParseErrors(object):
+    """counts lines that couldn't be parsed and keeps the first few so they can be shown"""
+    max_samples = 5
+
+    def __init__(self):
+        self.count = 0
+        self.samples = []
+
+    def add(self, line):
+        self.count += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(line.decode('utf-8', 'replace') if isinstance(line, bytes) else line)
+
+    def merge(self, other):
+        self.count += other.count
+        self.samples += other.samples[:self.max_samples - len(self.samples)]
+
+    def report(self, filename):
+        if self.count:
+            print('Could not process %d lines of %s, e.g.:' % (self.count, filename))
+            for line in self.samples:
+                print('    %s' % line.rstrip())
+
+
+def loads(line):
+    # orjson refuses the NaN and Infinity that json.dumps writes, so lines it can't decode get a second try with
+    # the standard library (the data mustn't depend on which decoder is installed)
+    try:
+        return fast_loads(line)
+    except ValueError:  # includes orjson.JSONDecodeError
+        return json.loads(line)
+
+
+def parse_lines(lines, errors):
+    # JSON-decodes a list of byte strings, skipping blank lines and counting the bad ones
+    log_data = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            data_in = loads(line)
+        except ValueError:
+            errors.add(line)
+            continue  # skip this line and move on
+        if isinstance(data_in, dict):
+            log_data.append(data_in)
+        else:
+            errors.add(line)
+    return log_data
+
+
+def last_line_end(filename, end=None):
+    # byte offset just past the last newline before end, i.e. where the complete lines stop
+    if end is None and not cheap_seeks(filename):
+        return scan(filename)[1]  # (noted when a bz2 or xz log was read through)
+    if end is None:
+        end = log_size(filename)
+    with open_log(filename) as log_file:
+        position = end
+        while position > 0:
+            block_start = max(0, position - 65536)
+            log_file.seek(block_start)
+            block = log_file.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            position = block_start
+    return 0
+
+
+def line_ranges(filename, start, end, chunk_size):
+    # splits [start, end) into (start, end) byte ranges that each begin at the start of a line
+    ranges = []
+    with open_log(filename) as log_file:
+        while start < end:
+            split = start + chunk_size
+            if split >= end:
+                split = end
+            else:
+                log_file.seek(split)
+                log_file.readline()  # move to the next line boundary
+                split = min(log_file.tell(), end)
+            ranges.append((start, split))
+            start = split
+    return ranges
+
+
+def stream_ranges(filename, start, end, chunk_size):
+    # as line_ranges for a log that's decompressed in one pass (bz2, xz), but yields (start, end, the bytes in
+    # between, estimated end) as it goes, for about chunk_size bytes at a time. With end None it goes to the last
+    # complete line; the estimate of where that is comes from how much of the compressed file has been read.
+    if end is None and scanned(filename) is not None:
+        end = scanned(filename)[1]
+    if end is not None and start >= end:
+        return
+    pieces, pending = [], 0
+    for offset, data, fraction in stream(filename, start):
+        if end is not None and offset + len(data) > end:
+            pieces.append(data[:end - offset])
+            break
+        pieces.append(data)
+        pending += len(data)
+        if pending >= chunk_size:
+            chunk = b''.join(pieces)
+            split = chunk.rfind(b'\n') + 1
+            if split:
+                estimated_end = end or max(start + split, int((offset + len(data)) / fraction))
+                yield start, start + split, chunk[:split], estimated_end
+                start += split
+                pieces, pending = [chunk[split:]], len(chunk) - split
+    chunk = b''.join(pieces)
+    if end is None:
+        chunk = chunk[:chunk.rfind(b'\n') + 1]  # an unterminated last line is left to LogTail
+    if chunk:
+        yield start, start + len(chunk), chunk, start + len(chunk)
+
+
+def read_range(filename, start, end):
+    with open_log(filename) as log_file:
+        log_file.seek(start)
+        return log_file.read(end - start)
+
+
+def parse_range(filename, start, end, data=None):
+    # worker: parses the lines in [start, end) (data, if they've been read already) into a SignalStore
+    # returns the store, the first record (for the header) and the parse errors
+    errors = ParseErrors()
+    with span('read', rows=end - start):  # in a worker process there's no trace, so these do nothing
+        lines = (read_range(filename, start, end) if data is None else data).split(b'\n')
+    with span('json', rows=len(lines)):
+        log_data = parse_lines(lines, errors)
+    with span('columns', rows=len(log_data)):
+        store = SignalStore()
+        store.append_rows(log_data)
+    store.trim()  # don't pickle the spare capacity back to the parent
+    return store, log_data[0] if log_data else None, errors
+
+
+def map_ranges(func, filename, start=0, end=None, processes=None, cancel=None):
+    # runs func(filename, start, end) over newline-aligned chunks of the file, in a process pool if it's big enough
+    # yields (result, byte offset the chunk ends at, end) in file order, so callers can show progress as chunks
+    # finish. If cancel (a threading.Event) gets set, raises Cancelled between chunks and drops the chunks still
+    # queued.
+    if not cheap_seeks(filename):
+        # a bz2 or xz log can only be read from the start, so it's decompressed once as it's parsed, with func
+        # given each chunk's bytes as a fourth argument; end may then be an estimate until the last chunk
+        for range_start, range_end, data, estimated_end in stream_ranges(filename, start, end, min_chunk_size):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            yield func(filename, range_start, range_end, data), range_end, estimated_end
+        return
+    if end is None:
+        end = last_line_end(filename)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or end - start < parallel_threshold or compression(filename):
+        # a gzip log is read here, where its seek index is
+        for range_start, range_end in line_ranges(filename, start, end, min_chunk_size):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            yield func(filename, range_start, range_end), range_end, end
+        return
+    chunk_size = max(min_chunk_size, (end - start) // (processes * 4) + 1)  # a few chunks each evens out the load
+    ranges = line_ranges(filename, start, end, chunk_size)
+    executor = ProcessPoolExecutor(max_workers=min(processes, len(ranges)))
+    try:
+        results = executor.map(func, *zip(*[(filename, a, b) for a, b in ranges]))
+        for result, (_, range_end) in zip(results, ranges):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            yield result, range_end, end
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def read_log(filename, start=0, end=None, processes=None, progress=None, cancel=None):
+    # parses the complete JSON lines of a log between byte offsets start and end, in parallel for large files
+    # returns a SignalStore, the first record and the parse errors
+    # progress, if given, is called with (bytes parsed, bytes to parse, rows so far) after each chunk
+    # (end None is the last complete line; for a bz2 or xz log that's found by the same pass that parses it)
+    store = None
+    first_line = None
+    errors = ParseErrors()
+    for (part, part_first_line, part_errors), range_end, end in map_ranges(parse_range, filename, start, end,
+                                                                           processes, cancel):
+        if store is None:
+            store = part
+        else:
+            store.extend(part)
+        if first_line is None:
+            first_line = part_first_line
+        errors.merge(part_errors)
+        if progress is not None:
+            progress(range_end - start, end - start, len(store))
+    if store is None:  # nothing between start and end
+        store = SignalStore()
+    errors.report(filename)
+    return store, first_line, errors
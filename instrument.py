@@ -0,0 +1,155 @@
+"""stage timing for loads and refreshes.
+
+    with trace('refresh', 'Refreshing plot...') as root:     # one file per trace when tracing is on
+        with span('plot data', rows=len(rows)):
+            ...
+
+Off unless MHD_TRACE is set ('json' for a nested span tree, 'chrome' for chrome://tracing / Perfetto);
+files go to MHD_TRACE_DIR (default: the working directory). MHD_PROFILE=<trace name> also runs the next
+trace of that name under cProfile. When off, trace() and span() just print their message."""
+import os
+import json
+import threading
+import cProfile
+import pstats
+from time import perf_counter
+from datetime import datetime
+
+
+trace_format = os.environ.get('MHD_TRACE') or None
+trace_dir = os.environ.get('MHD_TRACE_DIR', '.')
+profile_name = os.environ.get('MHD_PROFILE') or None
+enabled = bool(trace_format or profile_name)
+
+local = threading.local()  # .root: the trace being recorded on this thread, .stack: its open spans
+
+
+def configure(format=None, directory='.', profile=None):
+    # the same as the environment variables, for scripts
+    global trace_format, trace_dir, profile_name, enabled
+    trace_format = format
+    trace_dir = directory
+    profile_name = profile
+    enabled = bool(trace_format or profile_name)
+
+
+class NullSpan(object):
+    """stands in for a span when nothing is being recorded"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, rows):
+        pass
+
+
+null_span = NullSpan()
+
+
+class Span(object):
+    """one timed stage, with the stages inside it"""
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.start = None
+        self.end = None
+        self.children = []
+        self.thread = threading.get_ident()
+
+    def count(self, rows):
+        # the number of rows the stage handled, when it's only known part way through
+        self.rows = rows
+
+    def __enter__(self):
+        local.stack[-1].children.append(self)
+        local.stack.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end = perf_counter()
+        local.stack.pop()
+        return False
+
+    def duration(self):
+        return (self.end or perf_counter()) - self.start
+
+    def as_dict(self):
+        return {'name': self.name, 'seconds': self.duration(), 'rows': self.rows,
+                'children': [child.as_dict() for child in self.children]}
+
+    def chrome_events(self, origin):
+        # complete ('X') events with microsecond times, as chrome://tracing expects
+        event = {'name': self.name, 'cat': 'mhd', 'ph': 'X', 'pid': os.getpid(), 'tid': self.thread,
+                 'ts': (self.start - origin) * 1e6, 'dur': self.duration() * 1e6}
+        if self.rows is not None:
+            event['args'] = {'rows': self.rows}
+        return [event] + [e for child in self.children for e in child.chrome_events(origin)]
+
+
+class Trace(Span):
+    """the outermost span on a thread; written out (and maybe profiled) when it ends"""
+    def __init__(self, name, rows=None):
+        super().__init__(name, rows)
+        self.profiler = None
+
+    def __enter__(self):
+        global profile_name
+        local.root = self
+        local.stack = [self]
+        if profile_name == self.name:
+            profile_name = None  # just the one
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end = perf_counter()
+        if self.profiler is not None:
+            self.profiler.disable()
+        local.root = None
+        local.stack = []
+        self.write()
+        return False
+
+    def write(self):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        try:
+            os.makedirs(trace_dir, exist_ok=True)
+            if trace_format:
+                filename = os.path.join(trace_dir, 'trace-%s-%s.json' % (self.name.replace(' ', '_'), stamp))
+                with open(filename, 'w') as trace_file:
+                    if trace_format == 'json':
+                        json.dump(self.as_dict(), trace_file, indent=1)
+                    else:
+                        json.dump({'traceEvents': self.chrome_events(self.start)}, trace_file)
+            if self.profiler is not None:
+                filename = os.path.join(trace_dir, 'profile-%s-%s.prof' % (self.name.replace(' ', '_'), stamp))
+                self.profiler.dump_stats(filename)
+                print('Profile of %s written to %s' % (self.name, filename))
+                pstats.Stats(self.profiler).sort_stats('cumulative').print_stats(20)
+        except OSError as e:
+            print('Could not write trace: %s' % e)
+
+
+def trace(name, message=None, rows=None):
+    # starts recording on this thread, unless something already is, in which case it's just a span
+    if message:
+        print(message)
+    if not enabled:
+        return null_span
+    if getattr(local, 'root', None) is not None:
+        return Span(name, rows)
+    return Trace(name, rows)
+
+
+def span(name, message=None, rows=None):
+    # a stage inside the current trace; does nothing but print if there isn't one
+    if message:
+        print(message)
+    if not enabled or getattr(local, 'root', None) is None:
+        return null_span
+    return Span(name, rows)
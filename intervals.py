@@ -0,0 +1,92 @@
+from datetime import datetime
+import numpy as np
+
+
+def as_seconds(times):
+    # datetime / datetime64 / epoch seconds -> epoch seconds (times without a zone are taken as they are)
+    if isinstance(times, datetime):
+        return int((times - datetime(1970, 1, 1)).total_seconds())
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype('datetime64[s]').astype(np.int64)
+    return times
+
+
+def on_time_before(starts, ends, times):
+    # how many seconds of the runs (sorted, not overlapping) are before each time
+    done = np.concatenate([[0], np.cumsum(ends - starts)])
+    started = np.searchsorted(starts, times, side='right')
+    overhang = np.maximum(ends[np.maximum(started - 1, 0)] - times, 0) if len(starts) else 0
+    return done[started] - np.where(started > 0, overhang, 0)
+
+
+class IntervalIndex(object):
+    """the runs of every channel as sorted start and end arrays. A channel's runs never overlap, so both
+    arrays are sorted and every query is a binary search per channel rather than a scan of the runs."""
+    def __init__(self, channels, starts, ends, n_channels=None):
+        channels = np.asarray(channels)
+        starts = as_seconds(starts)
+        ends = as_seconds(ends)
+        if n_channels is None:
+            n_channels = int(channels.max()) + 1 if len(channels) else 0
+        self.starts = []
+        self.ends = []
+        for cn in range(n_channels):
+            mine = channels == cn
+            order = np.argsort(starts[mine], kind='stable')
+            self.starts.append(starts[mine][order])
+            self.ends.append(ends[mine][order])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def active_at(self, t):
+        # channels that were on at time t
+        t = as_seconds(t)
+        active = []
+        for cn, (starts, ends) in enumerate(zip(self.starts, self.ends)):
+            last = np.searchsorted(starts, t, side='right') - 1
+            if last >= 0 and ends[last] > t:
+                active.append(cn)
+        return active
+
+    def window(self, cn, a, b):
+        # positions of channel cn's runs that intersect [a, b)
+        return np.searchsorted(self.ends[cn], a, side='right'), np.searchsorted(self.starts[cn], b)
+
+    def overlapping(self, a, b):
+        # (channel, start, end) arrays of every run intersecting [a, b), ordered by channel then start
+        a, b = as_seconds(a), as_seconds(b)
+        channels, starts, ends = [], [], []
+        for cn in range(len(self)):
+            first, stop = self.window(cn, a, b)
+            channels.append(np.full(max(stop - first, 0), cn))
+            starts.append(self.starts[cn][first:stop])
+            ends.append(self.ends[cn][first:stop])
+        if not channels:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(channels), np.concatenate(starts), np.concatenate(ends)
+
+    def clipped(self, cn, a, b):
+        # channel cn's runs cut down to [a, b)
+        first, stop = self.window(cn, a, b)
+        return (np.clip(self.starts[cn][first:stop], a, b), np.clip(self.ends[cn][first:stop], a, b))
+
+    def overlap(self, cn_a, cn_b, a=None, b=None):
+        # seconds that both channels were on, optionally within [a, b)
+        # each of a's runs is measured against b's cumulative on time, so this is O(n log m), not n * m
+        a = as_seconds(a) if a is not None else np.iinfo(np.int64).min
+        b = as_seconds(b) if b is not None else np.iinfo(np.int64).max
+        starts_a, ends_a = self.clipped(cn_a, a, b)
+        starts_b, ends_b = self.clipped(cn_b, a, b)
+        if not len(starts_a) or not len(starts_b):
+            return 0
+        return int(np.sum(on_time_before(starts_b, ends_b, ends_a) - on_time_before(starts_b, ends_b, starts_a)))
+
+    def coactivity(self, a=None, b=None):
+        # channels x channels matrix of seconds both were on within [a, b); the diagonal is each one's on time
+        matrix = np.zeros((len(self), len(self)), dtype=np.int64)
+        for i in range(len(self)):
+            for j in range(i, len(self)):
+                matrix[i, j] = matrix[j, i] = self.overlap(i, j, a, b)
+        return matrix
@@ -0,0 +1,159 @@
+"""live ingest: log lines pushed to a local socket as the logger writes them, instead of polling the file
+
+The logger (or emitter.py, which stands in for it) sends the same newline-terminated lines it writes to the log;
+the file stays the durable record. Addresses are 'host:port' for TCP, 'udp://host:port' for UDP datagrams (each
+holding one or more lines) or a path for a Unix socket (not on Windows). A LiveFeed only collects complete lines;
+LiveModel puts the JSON ones into a store that keeps the last few hours."""
+import os
+import socket
+import threading
+import socketserver
+from collections import deque
+import numpy as np
+import matplotlib.dates
+from ingest import parse_lines, ParseErrors
+from logmodel import LogModel
+from eventindex import EventIndex
+
+
+default_address = 'localhost:5555'
+default_hours = 4  # how much of the stream LiveModel keeps
+max_pending = 1000000  # lines kept for read_new while nobody's reading (the oldest go first)
+
+
+def parse_address(address):
+    # -> ('tcp', (host, port)), ('udp', (host, port)) or ('unix', path)
+    if address.startswith('udp://'):
+        host, port = address[len('udp://'):].rsplit(':', 1)
+        return 'udp', (host, int(port))
+    if ':' in address and not os.path.isabs(address):
+        host, port = address.rsplit(':', 1)
+        return 'tcp', (host, int(port))
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError("%s would be a Unix socket, which this system doesn't have; use 'host:port' or "
+                         "'udp://host:port'" % address)
+    return 'unix', address
+
+
+class LineHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        feed = self.server.feed
+        if isinstance(self.request, tuple):  # a datagram, (data, socket): its last line ends with it
+            feed.receive(self.request[0] + b'\n')
+            return
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            feed.receive(data, self)
+        feed.receive(b'\n', self)  # so does the last line of a connection
+
+
+class LiveFeed(object):
+    """a socket server on its own threads that collects the lines sent to it until they're read. read_new()
+    has the same meaning as LogTail's, so a LogModel can follow a feed as if it were the log."""
+    def __init__(self, address=default_address):
+        self.filename = address  # (for messages, as with a LogTail)
+        self.offset = 0  # bytes received
+        self.lines = deque(maxlen=max_pending)
+        self.partial = {}  # connection -> the start of a line still coming in
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        kind, address = parse_address(self.filename)
+        if kind == 'unix':
+            if os.path.exists(address):
+                os.remove(address)  # left by a viewer that didn't close it
+            server_class = socketserver.ThreadingUnixStreamServer
+        elif kind == 'udp':
+            server_class = socketserver.ThreadingUDPServer
+        else:
+            server_class = socketserver.ThreadingTCPServer
+        server_class.allow_reuse_address = True
+        server_class.daemon_threads = True
+        self.server = server_class(address, LineHandler)
+        self.server.feed = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print('Listening for live log lines on %s' % self.filename)
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def receive(self, data, sender=None):
+        # sender is the connection data came over, if the rest of its last line may come later
+        with self.lock:
+            lines = (self.partial.pop(sender, b'') + data).split(b'\n')
+            if lines[-1]:
+                self.partial[sender] = lines[-1]
+            lines.pop()
+            self.lines.extend(line for line in lines if line.strip())
+            self.offset += len(data)
+
+    def read_lines(self):
+        # the complete lines received since the last call, oldest first (FurnaceDAQ lines can go to
+        # loader.parse_line from here)
+        with self.lock:
+            lines = list(self.lines)
+            self.lines.clear()
+        return lines
+
+    def read_new(self):
+        # a list of dicts for the JSON lines received since the last call (never None: a feed can't be rotated)
+        errors = ParseErrors()
+        log_data = parse_lines(self.read_lines(), errors)
+        errors.report(self.filename)
+        return log_data
+
+
+class LiveModel(LogModel):
+    """the last hours of rows sent to a LiveFeed, for a scrolling plot. Rows are added as they arrive, as with a
+    followed file; once the oldest are a quarter of that older again they're all dropped in one go, so the store
+    is only rebuilt now and then rather than on every row."""
+    slack = 0.25
+
+    def __init__(self, feed, hours=default_hours):
+        super().__init__()
+        self.tail = feed
+        self.hours = hours
+
+    def follow(self, progress=None, cancel=None):
+        # as LogModel.follow; the lists count as changed when old rows were dropped
+        new_rows, lists_changed = super().follow(progress, cancel)
+        if new_rows and self.trim():
+            lists_changed = True
+        return new_rows, lists_changed
+
+    def time_range(self):
+        # (first, last) date numbers of the rows kept, or None before any have a time
+        times = self.log_data.time[:len(self.log_data)]
+        if np.isnan(times).all():
+            return None
+        return np.nanmin(times), np.nanmax(times)
+
+    def trim(self):
+        time_range = self.time_range()
+        if time_range is None:
+            return False
+        cutoff = time_range[1] - self.hours / 24
+        if time_range[0] >= cutoff - self.slack * self.hours / 24:
+            return False
+        times = self.log_data.time[:len(self.log_data)]
+        self.log_data = self.log_data.take(np.flatnonzero(times >= cutoff))
+        self.signal_keys = []
+        self.event_list = []
+        self.events = EventIndex()
+        self.comment_list = []
+        self.index_log_data()
+        self.add_derived_keys()
+        return True
+
+    def date_range(self):
+        # (start, end) datetimes for the date range widgets, a second wider than the rows kept
+        first, last = self.time_range()
+        second = 1 / 86400
+        return tuple(matplotlib.dates.num2date(time).replace(tzinfo=None) for time in (first - second, last + second))
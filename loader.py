@@ -1,9 +1,12 @@
+import os
+import sys
 from datetime import datetime
 import json
-import pandas as pd
-import io
-import matplotlib.pyplot as plt
+import numpy as np
 import matplotlib.dates as mdates
+from ingest import map_ranges, read_range, ParseErrors
+from logfile import open_log, log_size
+from offsetindex import OffsetIndex
 
 
 log_filename = 'C:/Users/mgibson/Desktop/FurnaceDAQ.log'
@@ -11,56 +14,31 @@ channel_names = ['Fan', 'Boiler', 'Power', 'Living Room', 'Upstairs Office', 'Ba
 
 
 def run():
-    log_data = parse_file(log_filename)  # list of datetime, list-of-bits couples
-    last_turn_on = [0, 0, 0, 0, 0, 0, 0, 0]
-    total_run_time = [0, 0, 0, 0, 0, 0, 0, 0]
-    runs = [ [], [], [], [], [], [], [], [] ]  # lists of start/end couples
-    for (timestamp, status) in log_data:
-        for cn in range(0, 8):  # channel number
-            if last_turn_on[cn] == 0 and status[cn] == 1:
-                last_turn_on[cn] = timestamp
-            if last_turn_on[cn] and status[cn] == 0:
-                run_time = timestamp-last_turn_on[cn]
-                print(f'{channel_names[cn]} ran for {run_time}')
-                if total_run_time[cn] == 0:
-                    total_run_time[cn] = run_time
-                else:
-                    total_run_time[cn] += run_time
-                runs[cn].append((last_turn_on[cn], timestamp))
-                last_turn_on[cn] = 0
-
-    # Catch case where something's still on in the last record (power, usually)
-    timestamp, status = log_data[-1]
-    for cn in range(0, 8):  # channel number
-        if last_turn_on[cn] and status[cn] == 1:  # still running
-            run_time = timestamp - last_turn_on[cn]
-            total_run_time[cn] = run_time
-            runs[cn].append((last_turn_on[cn], timestamp))
+    import matplotlib.pyplot as plt  # only the script shows a window, so importing loader doesn't need pyplot
+    from rollup import RollupStore, DutyCycleChart  # rollup builds on the run detector below
+    from intervals import IntervalIndex
+    store = RollupStore(log_filename, len(channel_names))
+    store.update()  # only parses what was appended since the last run
+    total_run_time = store.totals().astype('timedelta64[s]')
 
     print('\nTotals:')
     for cn in range(0, 8):
-        print(f'{channel_names[cn]}: {total_run_time[cn]}')
-    # if append:
-    #     log_data = self.log_data + new_log_data
-    # else:
-    #     log_data = new_log_data
-    print('Done')
-
+        print(f'{channel_names[cn]}: {total_run_time[cn].item()}')
 
-    # df = pd.read_csv(io.StringIO(inp), header=None, names=["Task", "Start", "Finish", "Resource"] )
-    # df["Diff"] = df.Finish - df.Start
+    runs = np.concatenate([store.runs, store.open_runs()])
+    index = IntervalIndex(runs[:, 0], runs[:, 1], runs[:, 2], len(channel_names))
+    boiler = channel_names.index('Boiler')
+    co_activity = index.coactivity()
+    print('\nBoiler on at the same time as:')
+    for cn in range(0, 8):
+        if cn != boiler:
+            print(f'{channel_names[cn]}: {np.timedelta64(co_activity[boiler, cn], "s").item()}')
+    print('Done')
 
     fig, ax = plt.subplots(figsize=(6, 3))
-
-    labels = []
-    for i, channel in enumerate(channel_names):
-        labels.append(channel)
-        # data = [(r[0].timestamp(), r[1].timestamp() - r[0].timestamp()) for r in runs[i]]
-        data = [(r[0], r[1] - r[0]) for r in runs[i]]
-        ax.broken_barh(data, (i - 0.4, 0.8), color='crimson')
-
-    ax.set_yticks(range(len(labels)))
-    ax.set_yticklabels(labels)
+    # draws runs when zoomed in and duty-cycle bins when zoomed out. It redraws from the axes' callbacks, so it's
+    # kept on the figure, which holds it for as long as the window is open
+    fig.chart = DutyCycleChart(ax, store, channel_names)
     # ax.set_xlabel("time")
     # plt.xticks(rotation=90)
     fig.autofmt_xdate()
@@ -70,23 +48,93 @@ def run():
     plt.show()
 
 
-def parse_file(filename, append=False, reload=False):
+def log_arrays(log_data):
+    # (datetime, bits) couples -> datetime64 column and an N x channels matrix
+    times = np.array([timestamp for timestamp, _ in log_data], dtype='datetime64[s]')
+    bits = np.array([status for _, status in log_data], dtype=np.int8).reshape(len(log_data), -1)
+    return times, bits
+
+
+def channel_states(bits):
+    # 1 turns a channel on and 0 turns it off; anything else leaves it as it was
+    bits = np.asarray(bits)
+    state = bits == 1
+    known = state | (bits == 0)
+    if not known.all():
+        rows = np.where(known, np.arange(len(bits))[:, None], 0)
+        last_known = np.maximum.accumulate(rows, axis=0)  # the latest row that set each channel
+        state = np.take_along_axis(state & known, last_known, axis=0)
+    return state
+
+
+def detect_runs(times, bits):
+    # finds every on/off run of every channel. times is a datetime64 column, bits an N x channels matrix
+    # returns (channel, start, end) arrays, ordered by channel then start time.
+    # A run that's still on in the last record ends at that record's time.
+    state = channel_states(bits)
+    count, width = state.shape
+    if not count:
+        return np.zeros(0, dtype=np.intp), times[:0], times[:0]
+    # every row where a channel changes, over the whole matrix at once (row-major, so in time order)
+    changes = np.flatnonzero((state[1:] != state[:-1]).ravel())
+    # channels on in the first record turned on there; ones on in the last record turn off just after it
+    first_on = np.flatnonzero(state[0])
+    last_on = np.flatnonzero(state[-1])
+    rows = np.concatenate([np.zeros(len(first_on), dtype=np.intp), changes // width + 1,
+                           np.full(len(last_on), count, dtype=np.intp)])
+    channels = np.concatenate([first_on, changes % width, last_on])
+    order = np.argsort(channels, kind='stable')  # still in time order within each channel
+    rows, channels = rows[order], channels[order]
+    # each channel's edges alternate turn-on, turn-off
+    return channels[0::2], times[rows[0::2]], times[np.minimum(rows[1::2], count - 1)]
+
+
+def run_totals(channels, starts, ends, n_channels):
+    # total on time of each channel, as timedelta64 seconds
+    seconds = (ends - starts) / np.timedelta64(1, 's')
+    return np.bincount(channels, weights=seconds, minlength=n_channels).astype('timedelta64[s]')
+
+
+def parse_file(filename, append=False, reload=False, window=None):
     # if reload = True, we don't want to reset the start time and ideally we wouldn't reset the zoom state either
+    # window, a (start, end) couple of datetimes, reads just the lines in between, found with the offset index
     print('Processing file...')
-    with open(filename, 'r') as log_file:
-        log_data = []
-        log_file.seek(0)
-        for line in log_file:
-            try:
-                data_in = parse_line(line)
-            except Exception as e:
-                print('Could not parse line: %s' % line)
-                continue  # skip this line and move on
-            else:
-                log_data.append(data_in)
+    start, end = 0, log_size(filename)
+    if window is not None:
+        found = OffsetIndex(filename, line_time).update().window(*mdates.date2num(window))
+        if found is not None:
+            start, end = found[0], found[1] or end
+    log_data = []
+    errors = ParseErrors()
+    # large files are split into line-aligned chunks and parsed in a process pool
+    for (part, part_errors), _, _ in map_ranges(parse_range, filename, start, end):
+        log_data += part
+        errors.merge(part_errors)
+    errors.report(filename)
+    if window is not None:
+        log_data = [record for record in log_data if window[0] <= record[0] <= window[1]]
     return log_data
 
 
+def parse_range(filename, start, end, data=None):
+    # (data is the bytes in [start, end) when map_ranges has read them already)
+    log_data = []
+    errors = ParseErrors()
+    if data is None:
+        data = read_range(filename, start, end)
+    for line in data.decode('utf-8', 'replace').splitlines():
+        if not line.strip():
+            continue
+        try:
+            data_in = parse_line(line)
+        except Exception:
+            errors.add(line)
+            continue  # skip this line and move on
+        else:
+            log_data.append(data_in)
+    return log_data, errors
+
+
 def parse_line(line):
     splits = str.split(line)
     dt = datetime.strptime(f'{splits[0]} {splits[1]}', '%Y-%m-%d %H:%M:%S')
@@ -94,5 +142,112 @@ def parse_line(line):
     return dt, bits
 
 
+def line_time(line):
+    # the date number of one line, or None, for the offset index
+    try:
+        return mdates.date2num(parse_line(line.decode('utf-8', 'replace'))[0])
+    except Exception:
+        return None
+
+
+def read_records(filename, offset=0, errors=None):
+    # yields (byte offset after the line, datetime, bits) for each complete line from offset on, one at a time
+    # lines that can't be parsed come out as (offset, None, None) so the offset still moves past them.
+    # A last line without a newline is left for next time since it may still be being written.
+    with open_log(filename) as log_file:
+        log_file.seek(offset)
+        for line in log_file:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            text = line.decode('utf-8', 'replace')
+            timestamp = status = None
+            if text.strip():
+                try:
+                    timestamp, status = parse_line(text)
+                except Exception:
+                    if errors is not None:
+                        errors.add(text)
+            yield offset, timestamp, status
+
+
+class RunDetector(object):
+    """streaming version of detect_runs: records go in, edges and completed runs come out as they happen,
+    so memory doesn't grow with the log. checkpoint() captures where it got to so a later job can carry on."""
+    def __init__(self, n_channels=len(channel_names)):
+        self.offset = 0  # byte offset just past the last record processed
+        self.last_turn_on = [None] * n_channels  # when each channel that's currently on turned on
+        self.last_time = None  # timestamp of the last record processed
+
+    def edges(self, records):
+        # records -> (channel, timestamp, True for turned on / False for turned off, when an off's run started)
+        last_turn_on = self.last_turn_on
+        for offset, timestamp, status in records:
+            self.offset = offset
+            if status is None:
+                continue
+            for cn, bit in enumerate(status[:len(last_turn_on)]):
+                if bit == 1 and last_turn_on[cn] is None:
+                    last_turn_on[cn] = timestamp
+                    yield cn, timestamp, True, None
+                elif bit == 0 and last_turn_on[cn] is not None:
+                    start = last_turn_on[cn]
+                    last_turn_on[cn] = None
+                    yield cn, timestamp, False, start
+            self.last_time = timestamp
+
+    def runs(self, records):
+        # records -> completed (channel, start, end) runs
+        for cn, timestamp, on, start in self.edges(records):
+            if not on:
+                yield cn, start, timestamp
+
+    def open_runs(self):
+        # runs still going at the last record, ending there for now
+        return [(cn, start, self.last_time) for cn, start in enumerate(self.last_turn_on) if start is not None]
+
+    def checkpoint(self):
+        # only consistent once the runs() generator has been used up
+        return {'offset': self.offset,
+                'last_turn_on': [start and start.isoformat() for start in self.last_turn_on],
+                'last_time': self.last_time and self.last_time.isoformat()}
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        detector = cls(len(checkpoint['last_turn_on']))
+        detector.offset = checkpoint['offset']
+        detector.last_turn_on = [start and datetime.fromisoformat(start) for start in checkpoint['last_turn_on']]
+        detector.last_time = checkpoint['last_time'] and datetime.fromisoformat(checkpoint['last_time'])
+        return detector
+
+
+def update_runs(filename, checkpoint_filename, runs_filename):
+    # for a scheduled job: appends the runs completed since the last call to a CSV and saves where it got to
+    detector = RunDetector()
+    if os.path.exists(checkpoint_filename):
+        with open(checkpoint_filename, 'r') as checkpoint_file:
+            detector = RunDetector.from_checkpoint(json.load(checkpoint_file))
+        if detector.offset > log_size(filename):
+            print(f'{filename} is shorter than the checkpoint, starting over')
+            detector = RunDetector()
+    errors = ParseErrors()
+    count = 0
+    with open(runs_filename, 'a') as runs_file:
+        for cn, start, end in detector.runs(read_records(filename, detector.offset, errors)):
+            runs_file.write(f'{channel_names[cn]},{start.isoformat()},{end.isoformat()},'
+                            f'{(end - start).total_seconds():.0f}\n')
+            count += 1
+    errors.report(filename)
+    # write the checkpoint only once the runs are safely stored, and atomically
+    with open(checkpoint_filename + '.tmp', 'w') as checkpoint_file:
+        json.dump(detector.checkpoint(), checkpoint_file)
+    os.replace(checkpoint_filename + '.tmp', checkpoint_filename)
+    print(f'{count} new runs, up to byte {detector.offset} of {filename}')
+    return count
+
+
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    if len(sys.argv) == 4:  # loader.py log checkpoint.json runs.csv
+        update_runs(*sys.argv[1:])
+    else:
+        run()
\ No newline at end of file
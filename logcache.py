@@ -0,0 +1,130 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from signalstore import SignalStore, category_keys
+from logfile import open_log, compression
+
+
+cache_version = 2
+sample_size = 65536  # bytes hashed at the start of the log, and just before the cached offset
+
+
+def file_digest(filename, start, end, raw=False):
+    with open(filename, 'rb') if raw else open_log(filename) as log_file:
+        log_file.seek(start)
+        return hashlib.sha1(log_file.read(end - start)).hexdigest()
+
+
+class LogCache(object):
+    """sidecar directory next to a log holding its parsed columns as raw arrays, so later opens can
+    memory-map them instead of parsing JSON. meta.json records which part of which file they came from."""
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.path = self.filename + '.cache'
+        self.meta = None  # what's on disk right now
+        self.status = None  # what load() found: 'hit', 'grown' or None
+
+    def column_path(self, name):
+        return os.path.join(self.path, name)
+
+    def read_meta(self):
+        try:
+            with open(self.column_path('meta.json'), 'r') as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get('version') == cache_version else None
+
+    def digests(self, offset):
+        # (head, tail) digests of the part of the log parsed so far. A compressed log is an archive rather
+        # than something still being written, so the ends of the compressed file will do, without decompressing
+        if compression(self.filename):
+            size = os.path.getsize(self.filename)
+            return (file_digest(self.filename, 0, min(size, sample_size), raw=True),
+                    file_digest(self.filename, max(0, size - sample_size), size, raw=True))
+        return (file_digest(self.filename, 0, min(offset, sample_size)),
+                file_digest(self.filename, max(0, offset - sample_size), offset))
+
+    def identity(self, offset):
+        # what a log that has been parsed up to offset looks like
+        stat = os.stat(self.filename)
+        head, tail = self.digests(offset)
+        return {'path': self.filename, 'size': stat.st_size, 'mtime': stat.st_mtime, 'offset': offset,
+                'head': head, 'tail': tail}
+
+    def check(self, meta):
+        # 'hit' if the log is unchanged, 'grown' if lines were only appended, None if the cache is stale
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        offset = meta['offset']
+        if meta['path'] != self.filename or not meta['length']:
+            return None
+        if not compression(self.filename) and stat.st_size < offset:
+            return None
+        if self.digests(offset) != (meta['head'], meta['tail']):
+            return None
+        if stat.st_size == meta['size'] and stat.st_mtime == meta['mtime']:
+            return 'hit'
+        return 'grown'
+
+    def load(self):
+        # returns (store, state, byte offset parsed up to) or None
+        # the arrays are copy-on-write memory maps of the cache files, so nothing is read until it's used
+        meta = self.read_meta()
+        status = self.status = meta and self.check(meta)
+        if not status:
+            return None
+        length = meta['length']
+        store = SignalStore()
+        store.length = store.capacity = length
+        store.time = np.memmap(self.column_path('time.f8'), dtype=np.float64, mode='c', shape=(length,))
+        for num, key in enumerate(meta['columns']):
+            store.columns[key] = np.memmap(self.column_path('%d.f8' % num), dtype=np.float64, mode='c',
+                                           shape=(length,))
+        for key in category_keys:
+            store.codes[key] = np.memmap(self.column_path(key + '.i4'), dtype=np.int32, mode='c', shape=(length,))
+            store.categories[key] = meta['categories'][key]
+            store.category_lookup[key] = {text: code for code, text in enumerate(store.categories[key])}
+        store.keys = dict.fromkeys(meta['keys'])
+        if meta['formats']:
+            store.time_parser.formats = tuple(meta['formats'])
+        self.meta = meta
+        print('Loaded %d cached rows from %s (%s)' % (length, self.path, 'unchanged' if status == 'hit' else 'grown'))
+        return store, meta['state'], meta['offset']
+
+    def save(self, store, state, offset):
+        # writes store to the cache; if the cache already holds the start of it, only the new rows are appended
+        start = 0
+        if self.meta and self.meta['length'] <= store.length:
+            start = self.meta['length']
+        try:
+            if not start:
+                shutil.rmtree(self.path, ignore_errors=True)
+                os.makedirs(self.path)
+            columns = list(self.meta['columns']) if start else []
+            columns += [key for key in store.columns if key not in columns and key not in store.derived]
+            arrays = [('time.f8', store.time)]
+            arrays += [('%d.f8' % num, store.columns[key]) for num, key in enumerate(columns)]
+            arrays += [(key + '.i4', store.codes[key]) for key in category_keys]
+            for name, array in arrays:
+                path = self.column_path(name)
+                first = start if os.path.exists(path) else 0  # a column may first appear in the new rows
+                with open(path, 'r+b' if first else 'wb') as column_file:
+                    if first and os.path.getsize(path) != first * array.itemsize:
+                        column_file.truncate(first * array.itemsize)  # drop anything left by an interrupted save
+                    column_file.seek(0, os.SEEK_END)
+                    array[first:store.length].tofile(column_file)
+
+            meta = self.identity(offset)
+            meta.update({'version': cache_version, 'length': store.length, 'columns': columns,
+                         'categories': store.categories, 'keys': list(store.keys), 'formats': store.time_parser.formats, 'state': state})
+            with open(self.column_path('meta.json'), 'w') as meta_file:
+                json.dump(meta, meta_file)
+        except OSError as e:
+            print('Could not write cache %s: %s' % (self.path, e))
+            return
+        self.meta = meta
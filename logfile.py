@@ -0,0 +1,219 @@
+"""opens logs whether or not they've been compressed for archiving (.gz, .bz2, .xz)
+
+Offsets everywhere are offsets into the uncompressed text. A gzip file gets a seek-point index the first time
+it's read, so later reads at an offset (a chunk of the file, a time window) only decompress from the point just
+before it. bz2 and xz decompressors can't be copied, so seeking those means decompressing from the start again;
+they're read in one pass from the start instead (stream), which notes their size on the way."""
+import os
+import io
+import bz2
+import lzma
+import zlib
+import threading
+
+openers = {'.bz2': bz2.open, '.xz': lzma.open}
+compressed_suffixes = ['.gz'] + list(openers)
+seek_spacing = 4 * 2**20  # uncompressed bytes between gzip seek points
+read_size = 65536  # compressed bytes decompressed at a time
+
+indexes = {}  # absolute path -> GzipIndex, for the life of the process
+sizes = {}  # absolute path -> (size, mtime, uncompressed size, end of the last complete line) of bz2/xz files
+lock = threading.Lock()
+
+
+def compression(filename):
+    # the compressed suffix of filename, or None for a plain log
+    suffix = os.path.splitext(filename)[1].lower()
+    return suffix if suffix in compressed_suffixes else None
+
+
+def inflate(compressed_file, decompressor):
+    # yields the output of decompressor as it's fed compressed_file from where it is, along with a copy of the
+    # decompressor and the compressed offset after each piece. Gzip members one after the other are all read.
+    while True:
+        data = compressed_file.read(read_size)
+        if not data:
+            return
+        while data:
+            if decompressor.eof:
+                if not data.strip(b'\0'):
+                    return  # padding after the last member
+                decompressor = zlib.decompressobj(31)
+            output = decompressor.decompress(data)
+            data = decompressor.unused_data if decompressor.eof else b''
+            yield output, decompressor, compressed_file.tell() - len(data)
+
+
+class GzipIndex(object):
+    """seek points through a gzip file: a copy of the decompressor about every seek_spacing bytes of output,
+    with where it had got to in the compressed file, so a read at any offset starts from the point before it"""
+    def __init__(self, filename):
+        self.filename = filename
+        stat = os.stat(filename)
+        self.stamp = (stat.st_size, stat.st_mtime)
+        self.points = [(0, 0, zlib.decompressobj(31))]  # (uncompressed offset, compressed offset, decompressor)
+        self.size = 0
+        with open(filename, 'rb') as compressed_file:
+            for output, decompressor, compressed_offset in inflate(compressed_file, zlib.decompressobj(31)):
+                self.size += len(output)
+                if self.size - self.points[-1][0] >= seek_spacing:
+                    self.points.append((self.size, compressed_offset, decompressor.copy()))
+
+    def point_before(self, offset):
+        lo, hi = 0, len(self.points)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.points[mid][0] <= offset:
+                lo = mid
+            else:
+                hi = mid
+        return self.points[lo]
+
+
+def gzip_index(filename):
+    # the index of a gzip file, built on first use and again if the file changes
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    with lock:
+        index = indexes.get(path)
+        if index is None or index.stamp != (stat.st_size, stat.st_mtime):
+            print('Indexing %s...' % filename)
+            index = indexes[path] = GzipIndex(path)
+        return index
+
+
+class GzipReader(io.RawIOBase):
+    """a seekable read-only view of the uncompressed contents of a gzip file, through its index"""
+    def __init__(self, filename):
+        super().__init__()
+        self.index = gzip_index(filename)
+        self.compressed_file = open(filename, 'rb')
+        self.position = 0
+        self.pieces = None  # the inflate generator, when it's lined up with self.position
+        self.pending = b''  # output already decompressed past self.position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.index.size
+        offset = max(0, offset)
+        if offset != self.position:
+            if self.pieces is not None and self.position < offset < self.position + len(self.pending):
+                self.pending = self.pending[offset - self.position:]  # already decompressed
+            else:
+                self.pieces = None
+                self.pending = b''
+            self.position = offset
+        return self.position
+
+    def start(self):
+        # lines the decompressor up with self.position from the closest seek point before it
+        point_offset, compressed_offset, decompressor = self.index.point_before(self.position)
+        self.compressed_file.seek(compressed_offset)
+        self.pieces = (output for output, _, _ in inflate(self.compressed_file, decompressor.copy()))
+        skip = self.position - point_offset
+        while skip > 0:
+            output = next(self.pieces, None)
+            if output is None:
+                break
+            if len(output) > skip:
+                self.pending = output[skip:]
+            skip -= len(output)
+
+    def readinto(self, buffer):
+        if self.pieces is None:
+            self.start()
+        while not self.pending:
+            output = next(self.pieces, None)
+            if output is None:
+                return 0
+            self.pending = output
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        self.position += count
+        return count
+
+    def close(self):
+        self.compressed_file.close()
+        super().close()
+
+
+def open_log(filename):
+    # a binary file object over the uncompressed log, for reading only
+    suffix = compression(filename)
+    if suffix is None:
+        return open(filename, 'rb')
+    if suffix == '.gz':
+        return io.BufferedReader(GzipReader(filename), buffer_size=read_size)
+    return openers[suffix](filename, 'rb')
+
+
+def stream(filename, start=0):
+    # a bz2/xz log: yields (offset, data, fraction of the compressed file read so far) for the uncompressed text
+    # from start on, decompressing it once. A pass that gets to the end notes the size, for log_size.
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    offset = line_end = 0
+    with open(path, 'rb') as compressed_file, openers[compression(path)](compressed_file, 'rb') as log_file:
+        while True:
+            data = log_file.read(read_size)
+            if not data:
+                break
+            newline = data.rfind(b'\n')
+            if newline >= 0:
+                line_end = offset + newline + 1
+            if offset + len(data) > start:
+                skip = max(0, start - offset)
+                yield offset + skip, data[skip:], compressed_file.tell() / max(stat.st_size, 1)
+            offset += len(data)
+    with lock:
+        sizes[path] = (stat.st_size, stat.st_mtime, offset, line_end)
+
+
+def scanned(filename):
+    # (uncompressed size, end of the last complete line) of a bz2/xz log if a pass has got to the end of it as it
+    # is now, otherwise None
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    with lock:
+        size, mtime, uncompressed, line_end = sizes.get(path, (None, None, None, None))
+    if (size, mtime) != (stat.st_size, stat.st_mtime):
+        return None
+    return uncompressed, line_end
+
+
+def scan(filename):
+    # as scanned, decompressing the log to find out if need be
+    extent = scanned(filename)
+    if extent is None:
+        for _ in stream(filename):
+            pass
+        with lock:
+            extent = sizes[os.path.abspath(filename)][2:]
+    return extent
+
+
+def log_size(filename):
+    # the uncompressed size of the log
+    suffix = compression(filename)
+    if suffix is None:
+        return os.path.getsize(filename)
+    if suffix == '.gz':
+        return gzip_index(filename).size
+    return scan(filename)[0]
+
+
+def cheap_seeks(filename):
+    # whether reading the log in many pieces costs about the same as reading it in one
+    return compression(filename) in (None, '.gz')
@@ -0,0 +1,345 @@
+from datetime import datetime, time, timedelta
+import numpy as np
+from logtail import LogTail
+from signalstore import SignalStore
+from logcache import LogCache
+from ingest import read_log, last_line_end, parse_lines, ParseErrors, loads
+from logfile import compression, cheap_seeks, open_log, log_size
+from offsetindex import OffsetIndex
+from eventindex import EventIndex
+from timeparse import TimeParser
+from schema import new_signal_keys, classifier
+from derived import derived_signals, available, derive
+from instrument import trace, span
+
+
+# the following items should not show data for zero values
+no_zero_signals = ['average_speed', 'jet_freq', 'pw_neg', 'pw_neg2', 'pw_pos', 'fdRatio', 'efficiency',
+                   'stream_phi', 'variance', 'jitter', 'stream_angle', 'jet_curr', 'jet_on',
+                   'drop_diam', 'pulse_delay', 'pulse_delay2', 'front_angle', 'side_angle', 'sats_frames',
+                   'drop_diam_calc', 'jitter_avg']
+
+only_while_jetting_signals = ['pw_pos', 'pw_neg', 'fdRatio', 'jet_freq', 'average_speed', 'stream_angle',
+                              'front_angle', 'side_angle']
+
+lazy_threshold = 256 * 2**20  # logs bigger than this with no cache are read a time window at a time (if they can seek)
+
+
+def line_time(line):
+    # the date number of one JSON line, or None, for the offset index
+    try:
+        record = loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+    time_value = TimeParser().parse([record])[0]
+    return None if np.isnan(time_value) else float(time_value)
+
+
+def day_range(date_number):
+    # (start, end of that day) datetimes for the date range widgets
+    import matplotlib.dates  # (here and below rather than at the top, so the viewer's window isn't kept waiting)
+    start_datetime = matplotlib.dates.num2date(date_number).replace(tzinfo=None)
+    start_datetime = (start_datetime + timedelta(milliseconds=500)).replace(microsecond=0)  # float rounding
+    return start_datetime, datetime.combine(start_datetime.date(), time().max)
+
+
+class LogModel(object):
+    """everything read out of the loaded log(s). Nothing in here touches Qt, so loading and
+    preparing plot data can run on a worker thread while the window stays responsive."""
+    def __init__(self):
+        self.log_data = SignalStore()  # what's in the file, one column per key
+        self.info = None  # nozzle, material, etc.
+        self.signal_keys = []  # non-duplicate list of keys appearing in the log, and the derived ones it can have
+        self.event_list = []  # non-duplicate list of events that appear in the log
+        self.events = EventIndex()  # rows of each event type, and of each comment (by its place in the list)
+        self.comment_list = []  # list of the actual comment texts
+        self.start_time = None  # a datetime representing start of run, used for x-axis
+        self.tail = None  # follows the last-loaded file so auto-update only parses new lines
+        self.index = None  # an OffsetIndex when only parts of a big log are read, as they're asked for
+        self.loaded = []  # and then the [start, end, rows] byte ranges in log_data, in file order
+
+    def load(self, filename, append=False, progress=None, cancel=None):
+        # returns (start, end) datetimes for the date range widgets, or None if the start time didn't change
+        with trace('load', 'Processing file...') as stage:
+            date_range = self.process_file(filename, append, progress, cancel)
+            if self.index is None:  # (a windowed load has already done this)
+                with span('calculated values', rows=len(self.log_data)):
+                    self.add_calculated_values()
+            stage.count(len(self.log_data))
+        return date_range
+
+    def follow(self, progress=None, cancel=None):
+        # reads lines appended to the file being followed. Returns None if it was truncated or rotated
+        # (so needs a full reload), otherwise (rows added, whether the key/event/comment lists changed)
+        with trace('follow') as stage:
+            end_before = self.tail.offset
+            with span('read'):
+                new_log_data = self.tail.read_new()
+            if new_log_data is None:
+                return None
+            if not new_log_data:
+                return 0, False
+            stage.count(len(new_log_data))
+            lists_before = (len(self.signal_keys), len(self.event_list), len(self.comment_list))
+            start = len(self.log_data)
+            with span('parse', rows=len(new_log_data)):
+                self.log_data.append_rows(new_log_data)
+            if self.index is not None:
+                self.add_loaded(end_before, self.tail.offset, len(new_log_data))
+            with span('index', rows=len(new_log_data)):
+                self.index_log_data(start)
+            with span('calculated values', rows=len(new_log_data)):
+                self.add_calculated_values(start)
+        return len(new_log_data), (len(self.signal_keys), len(self.event_list), len(self.comment_list)) != lists_before
+
+    def process_file(self, filename, append=False, progress=None, cancel=None):
+        self.tail = LogTail(filename)
+        if not append:
+            self.log_data = SignalStore()
+            self.info = None
+            self.signal_keys = []
+            self.event_list = []
+            self.events = EventIndex()
+            self.comment_list = []
+            self.index = None
+            self.loaded = []
+            # a sidecar cache lets us skip parsing whatever part of the file we've already seen
+            cache = LogCache(filename)
+            with span('cache') as stage:
+                cached = cache.load()
+                stage.count(len(cached[0]) if cached else 0)
+            if not cached and cheap_seeks(filename) and log_size(filename) > lazy_threshold:
+                date_range = self.open_window(filename, progress, cancel)
+                if date_range is not None:
+                    return date_range
+            if cached:
+                self.log_data, state, self.tail.offset = cached
+                self.info = state['info']
+                self.signal_keys = state['signal_keys']
+                self.event_list = state['event_list']
+                self.comment_list = state['comment_list']
+            cached_rows = len(self.log_data)
+            if not (cache.status == 'hit' and compression(filename)):  # an unchanged archive has nothing more
+                self.read_new_data(progress, cancel)
+            with span('index', rows=len(self.log_data) - cached_rows):
+                self.index_log_data(cached_rows)
+            if len(self.log_data) > cached_rows or not cached:
+                with span('cache save', rows=len(self.log_data) - cached_rows):
+                    cache.save(self.log_data, {'info': self.info, 'signal_keys': self.signal_keys,
+                                               'event_list': self.event_list, 'comment_list': self.comment_list},
+                               self.tail.offset)
+            start = 0
+        else:
+            start = self.read_new_data(progress, cancel)
+            if len(self.log_data) == start:
+                return None
+            with span('index', rows=len(self.log_data) - start):
+                self.index_log_data(start)
+
+        # get the start time -- it's the first time entry in the file (already parsed by log_data)
+        new_times = self.log_data.time[start:len(self.log_data)]
+        timed_rows = np.flatnonzero(~np.isnan(new_times))
+        if len(timed_rows) and not (append and self.start_time is not None):  # with append, the first file wins
+            date_range = day_range(new_times[timed_rows[0]])
+            self.start_time = date_range[0].time()
+            return date_range
+        return None
+
+    def open_window(self, filename, progress=None, cancel=None):
+        # a big log that hasn't been cached: index where its times are and read just the first day, which is
+        # what the date range starts as. Returns None (having read nothing) if the index can't find a window.
+        with span('offset index'):
+            index = OffsetIndex(filename, line_time).update()
+        if index.window(-np.inf, np.inf) is None:
+            return None
+        self.index = index
+        with open_log(filename) as log_file:
+            header = parse_lines([log_file.readline()], ParseErrors())
+        if header and header[0].get('nozzle', None):
+            self.info = header[0]
+        self.tail.offset = last_line_end(filename)  # auto-update carries on from the end
+        date_range = day_range(index.times[0])
+        self.start_time = date_range[0].time()
+        self.ensure_loaded(*date_range, progress=progress, cancel=cancel)
+        return date_range
+
+    def add_loaded(self, start, end, rows):
+        if self.loaded and self.loaded[-1][1] == start:
+            self.loaded[-1][1:] = [end, self.loaded[-1][2] + rows]
+        else:
+            self.loaded.append([start, end, rows])
+
+    def ensure_loaded(self, min_date_time, max_date_time, progress=None, cancel=None):
+        # for a log read a window at a time: parses whatever lines of the time range haven't been yet.
+        # Returns True if there were any (log_data and the lists are then rebuilt in file order)
+        if self.index is None:
+            return False
+        import matplotlib.dates
+        window = self.index.window(matplotlib.dates.date2num(min_date_time),
+                                   matplotlib.dates.date2num(max_date_time))
+        start, end = window
+        end = self.tail.offset if end is None else min(end, self.tail.offset)
+        missing = []
+        for loaded_start, loaded_end, _ in self.loaded + [[end, end, 0]]:
+            if loaded_start > start and start < end:
+                missing.append((start, min(loaded_start, end)))
+            start = max(start, loaded_end)
+        if not missing:
+            return False
+        with span('window', 'Reading %d more part(s) of the log...' % len(missing)) as stage:
+            parts = [(part_start, part_end, read_log(self.tail.filename, part_start, part_end, progress=progress,
+                                                     cancel=cancel)[0]) for part_start, part_end in missing]
+            rows = np.cumsum([0] + [loaded_rows for _, _, loaded_rows in self.loaded])
+            parts += [(loaded_start, loaded_end, self.log_data.take(np.arange(rows[num], rows[num + 1])))
+                      for num, (loaded_start, loaded_end, _) in enumerate(self.loaded)]
+            self.log_data = SignalStore()
+            self.loaded = []
+            for part_start, part_end, store in sorted(parts, key=lambda part: part[0]):
+                self.log_data.extend(store)
+                self.add_loaded(part_start, part_end, len(store))
+            stage.count(len(self.log_data))
+        self.signal_keys = []
+        self.event_list = []
+        self.events = EventIndex()
+        self.comment_list = []
+        self.index_log_data()
+        self.add_calculated_values()
+        return True
+
+    def read_new_data(self, progress=None, cancel=None):
+        # parses everything after the tail's offset into log_data: complete lines in parallel, then any last
+        # line that wasn't terminated. Returns the number of rows log_data had before.
+        start = len(self.log_data)
+        filename = self.tail.filename
+        end = last_line_end(filename) if cheap_seeks(filename) else None  # (a bz2 or xz log's is found as it's read)
+        if end is None or end > self.tail.offset:
+            with span('parse') as stage:
+                new_data, first_line, _ = read_log(filename, self.tail.offset, end, progress=progress, cancel=cancel)
+                stage.count(len(new_data))
+            if not start and first_line and first_line.get('nozzle', None):
+                self.info = first_line  # collects the metadata for use later
+            if start:
+                self.log_data.extend(new_data)
+            else:
+                self.log_data = new_data
+            self.tail.offset = last_line_end(filename) if end is None else end
+        with span('tail'):
+            new_log_data = self.tail.read_new()
+        if new_log_data:
+            if not len(self.log_data) and new_log_data[0].get('nozzle', None):
+                self.info = new_log_data[0]
+            self.log_data.append_rows(new_log_data)
+        return start
+
+    def index_log_data(self, start=0):
+        # retrieve keys, events, comments from log_data[start:]
+        log_data = self.log_data
+        signal_keys = self.signal_keys + new_signal_keys(log_data.keys, set(self.signal_keys))
+        event_list = self.event_list
+
+        # Process events: each distinct event string is classified once (the store keeps what it was classified
+        # as, so only event strings new since the last call are looked at), then rows are mapped by code
+        classified_before = len(log_data.event_types)
+        classified = [classifier.lookup(event) for event in log_data.categories['event'][classified_before:]]
+        event_types = [log_data.intern('event_type', event_type) for event_type, _ in classified]
+        log_data.event_types = np.concatenate([log_data.event_types, np.array(event_types, dtype=np.int32)])
+        log_data.comment_codes += [code for code, (_, comment) in enumerate(classified, classified_before) if comment]
+        event_codes = log_data.category_column('event')[start:]
+        log_data.category_column('event_type')[start:] = np.append(log_data.event_types, -1)[event_codes]
+        comments_before = len(self.events.comment_rows)
+        new_types = self.events.update(log_data, log_data.comment_codes)
+        comments = self.events.comment_rows[comments_before:]
+        comments = comments[comments >= start]  # (a new index also has the rows of a cached comment list)
+        self.comment_list += [log_data.category('event', row)[9:] for row in comments]
+        # (events that have their own subplot used to be omitted from the list here; that's disabled)
+        listed = set(event_list)
+        for code in new_types:
+            event_type = log_data.categories['event_type'][code]
+            if event_type not in listed:
+                listed.add(event_type)
+                event_list += [event_type]
+
+        self.event_list = sorted(event_list)
+        # the log's keys in order, then any derived ones (from add_derived_keys) after them as they were
+        self.signal_keys = (sorted(key for key in signal_keys if key in log_data.keys) +
+                            [key for key in signal_keys if key not in log_data.keys])
+
+    def add_derived_keys(self):
+        # offers the derived signals the log has the inputs for; they're only calculated when they're plotted
+        derived_keys = available(self.log_data.keys)
+        self.signal_keys = self.signal_keys + [key for key in derived_keys if key not in self.signal_keys]
+        return derived_keys
+
+    def add_calculated_values(self, start=0):
+        log_data = self.log_data
+        if 'drop_diam' in self.add_derived_keys():
+            camera_codes = [code for code, event in enumerate(log_data.categories['event'])
+                            if 'Triggered camera' in event]
+            camera_rows = np.flatnonzero(np.isin(log_data.category_column('event')[start:], camera_codes)) + start
+            for num in camera_rows:
+                # example: "Triggered camera, filename: 20180703-110254"
+                fn = log_data.category('event', num)[28:]  # extracts filename
+                # need to get speed from previous entry because illuminator stops nanny
+                sp = log_data.value('average_speed', num-1)
+                if sp == 0 or sp is None:
+                    sp = log_data.value('average_speed', num-2)
+                freq = log_data.value('jet_freq', num)
+                print('%s, %s, %s' % (fn, freq, sp))
+
+    def generate_plot_data(self, desired_plots, min_date_time, max_date_time, skip_no_data=False,
+                           skip_no_jetting=False, progress=None, cancel=None):
+        # make a dict called 'plot_data' of columns holding only the rows needed, with NaN placeholders
+        # returns plot_data and plot_rows, the positions in log_data of its rows
+        import matplotlib.dates
+        with trace('plot data', 'Generating plot data.') as stage:
+            self.ensure_loaded(min_date_time, max_date_time, progress, cancel)
+            log_data = self.log_data
+            # only look at rows within the requested range (rows with no date/time aren't in the index)
+            rows = log_data.time_index().range(matplotlib.dates.date2num(min_date_time),
+                                               matplotlib.dates.date2num(max_date_time))
+
+            def take(key):
+                if key in derived_signals and key not in log_data.keys:
+                    column = derive(log_data, key)  # (only as far as it hasn't been already)
+                else:
+                    column = log_data.column(key)
+                return column[rows] if column is not None else np.full(len(rows), np.nan)
+
+            jet_on = take('jet_on')
+            jetting = ~np.isnan(jet_on) & (jet_on != 0)
+            jet_factor = np.where(np.isnan(jet_on), 1, jet_on)  # rows without jet_on count as jetting
+
+            # bring in user-selected data
+            data_present = np.full(len(rows), not skip_no_data)  # all rows are included unless skip_no_data
+            values = {}
+            for item in desired_plots:
+                value = take(item)
+                valid = ~np.isnan(value) & (value != 0)
+                data_present |= valid  # one valid datum will set/leave this true
+                if item in only_while_jetting_signals:
+                    value = np.where(valid, value * jet_factor, np.nan)  # don't show when not jetting
+                if item in no_zero_signals:
+                    value = np.where(value == 0, np.nan, value)
+                values[item] = value
+            # check for no jetting switch
+            if skip_no_jetting:
+                data_present &= jetting
+            # check for no data
+            event_codes = log_data.category_column('event')[rows]
+            data_present |= event_codes >= 0  # always show any event
+
+            keep = np.flatnonzero(data_present)
+            plot_rows = rows[keep]
+            stage.count(len(plot_rows))
+            plot_data = {'time': log_data.time[plot_rows],
+                         'index': np.arange(len(keep)),
+                         'event': event_codes[keep],
+                         'event_type': log_data.category_column('event_type')[plot_rows],
+                         'odo': take('odo')[keep],
+                         'drop_count': take('drop_count')[keep]}
+            for item, value in values.items():
+                if item not in plot_data:  # don't rewrite data already there
+                    plot_data[item] = value[keep]
+            return plot_data, plot_rows
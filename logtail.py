@@ -0,0 +1,75 @@
+import os
+from ingest import parse_lines, ParseErrors, loads
+from logfile import open_log, log_size
+
+
+head_size = 256  # bytes from the start of the file used to recognise it after a rotation
+
+
+class LogTail(object):
+    """follows a growing JSON-lines log, returning only the records appended since the last read"""
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0  # byte offset just past the last complete line we've consumed
+        self.partial = b''  # an unterminated line at the end of the file, still being written
+        self.head = b''  # the first bytes of the file when we first read it
+        self.inode = None
+
+    def reset(self):
+        self.offset = 0
+        self.partial = b''
+        self.head = b''
+        self.inode = None
+
+    def rotated(self):
+        # the file was truncated, replaced or rewritten if it shrank, changed inode, or its first bytes differ
+        try:
+            stat = os.stat(self.filename)
+            size = log_size(self.filename)
+        except (OSError, EOFError, ValueError):  # (the last two from a compressed file that's still being written)
+            return True
+        if size < self.offset + len(self.partial):
+            return True
+        if self.inode and stat.st_ino and stat.st_ino != self.inode:
+            return True
+        if self.head:
+            with open_log(self.filename) as log_file:
+                if log_file.read(len(self.head)) != self.head:
+                    return True
+        return False
+
+    def read_new(self):
+        # returns a list of dicts for the lines appended since the last call,
+        # or None if the file was rotated/truncated and needs a full reload (the tail is reset in that case)
+        if self.offset and self.rotated():
+            self.reset()
+            return None
+
+        with open_log(self.filename) as log_file:
+            if not self.head:
+                self.head = log_file.read(head_size)
+                self.inode = os.stat(self.filename).st_ino
+            chunk = self.partial
+            if log_size(self.filename) > self.offset + len(self.partial):  # (a seek in a bz2 or xz log decompresses)
+                log_file.seek(self.offset + len(self.partial))
+                chunk += log_file.read()
+
+        lines = chunk.split(b'\n')
+        self.partial = lines.pop()  # whatever follows the last newline (usually b'')
+        consumed = len(chunk) - len(self.partial)
+        if self.partial:
+            # a complete JSON object can't grow any further, so a final line without a newline is done
+            try:
+                loads(self.partial)
+            except ValueError:
+                pass
+            else:
+                lines.append(self.partial)
+                consumed += len(self.partial)
+                self.partial = b''
+        self.offset += consumed
+
+        errors = ParseErrors()
+        log_data = parse_lines(lines, errors)
+        errors.report(self.filename)
+        return log_data
@@ -1,104 +1,25 @@
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog, QSizePolicy
+from time import perf_counter
+launched = perf_counter()  # for the cold-start times
+from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
 from PyQt5.QtCore import QTimer
 import PyQt5.uic
 # from PyQt5 import QtCore, QtGui
-import json
-import math
-from datetime import datetime, time
+from datetime import datetime
 import traceback
 from settings import Settings
-import matplotlib
-from time import perf_counter
-matplotlib.use('Qt5Agg')
-# import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.figure import Figure
-from matplotlib.ticker import FuncFormatter, MaxNLocator
-from mpldatacursor import datacursor
+from logtail import LogTail
+from session import LogSession
+from worker import Worker
+# matplotlib's Qt backend, the plotter and live ingest are imported when they're first needed, so the window
+# comes up without waiting for them
 
 
 # these are the defaults for settings saved in the registry
-default_settings = {'last_used_file': 'c:\\', 'x_axis': 'odo', 'last_used_params': [], 'last_used_events': []}
-
-# the are custom settings for the various quantities plotted.  These are defaults, the user can change them.
-per_axis_limits = {'average_speed': (1, 2.5),
-                   'stream_angle': (0, 20),
-                   'angle_compound': (0, 10),
-                   'angle_front': (-10, 10),
-                   'angle_side': (-10, 10),
-                   'front_angle': (-10, 10),
-                   'side_angle': (-10, 10),
-                   # 'reservoir_temp': (650, 800),
-                   'nozzle_setpoint': (650, 750),
-                   # 'nozzle_temp': (650, 750),
-                   # 'terminal_temp': (500, 580),
-                   'table_temp': (630, 700),
-                   # 'temp3': (630, 700),
-                   # 'neg_pw': (0, 250),
-                   # 'pos_pw': (50, 200),
-                   # 'jet_freq': (0, 200),
-                   'variance': (-.01, .5),
-                   'jitter': (-.01, .1),
-                   # 'o2_ppm': (0, 10),
-                   'moisture_ppm_in_v': (0, 10),
-                   'box_pressure': (0, 5),
-                   'pulse_delay': (0, 200),
-                   'drop_diam': (380, 410),
-                   'drop_diam_calc': (150, 500)
-                   }
-
-per_axis_markers = {'drop_diam_calc': ('x', 4),
-                    }
-
-default_height = 6  # proportional height of normal plots
-per_axis_heights = {'jet_on': 1}
-
-line_styles = {'Triggered camera': ['.80', '-'],
-               'Nozzle clean': ['y', '-'],
-               'Wire through nozzle orifice': ['y', '-'],
-               'Clog': ['r', '-'],
-               'Scraped bottom of nozzle face': ['b', '-'],
-               'Dross vacuum (manual)': ['g', '-'],
-               'Wiped dross from top of reservoir': ['g', '-'],
-               'Starting torture test': ['g', '-'],
-               'Torture test paused': ['r', '--'],
-               'Torture test resumed': ['g', '--'],
-               'Aborting torture test': ['r', '-'],
-               'Comment': ['k', '-'],
-               }
-
-# the following items should not show data for zero values
-no_zero_signals = ['average_speed', 'jet_freq', 'pw_neg', 'pw_neg2', 'pw_pos', 'fdRatio', 'efficiency',
-                   'stream_phi', 'variance', 'jitter', 'stream_angle', 'jet_curr', 'jet_on',
-                   'drop_diam', 'pulse_delay', 'pulse_delay2', 'front_angle', 'side_angle', 'sats_frames',
-                   'drop_diam_calc']
-
-only_while_jetting_signals = ['pw_pos', 'pw_neg', 'fdRatio', 'jet_freq', 'average_speed', 'stream_angle',
-                              'front_angle', 'side_angle']
-
-forbidden_keys = ['event', 'drop_count', 'date', 'time', 'rate', 'nozzle', 'material', 'operator', 'goal',
-                  'other_notes']
-
-key_sets = [['drop_diam', 'drop_diam_calc'],
-            ['nozzle_setpoint', 'nozzle_temp']]  # for future use, forces keys into one chart
-
-# these often have unique data appended so need to be stripped for use in the UI event list
-shortened_events = ['Triggered camera', 'Starting torture test', 'Aborting torture test', 'Completed cycle',
-                    'Torture test completed']
-
-# the following get their own graphs so they don't need to show up in the UI event list
-special_plots = {'Nozzle service': ['Nozzle purge', 'Nozzle service: wipe', 'Move to wipe position',
-                                    'Wiped dross from top of reservoir',
-                                    'Scraped bottom of nozzle face', 'Dross vacuum (manual)',
-                                    'Nozzle service: weigh drops', 'Nozzle service: free jet'],
-                 'Torture test': ['Torture test paused', 'Torture test resumed', 'Aborting torture test',
-                                  'Starting torture test', 'Torture test completed'],
-                 'Comments/videos': ['Comment', 'Triggered camera'],
-                 'Selected Events': []  # filled in later
-                 }
+default_settings = {'last_used_file': 'c:\\', 'x_axis': 'odo', 'last_used_params': [], 'last_used_events': [],
+                    'live_address': ''}
+live_interval = 500  # ms between updates from a live feed
 
 
 class MHDLogView(QApplication):
@@ -106,6 +27,8 @@ class MHDLogView(QApplication):
         QApplication.__init__(self, sys.argv)
         settings = Settings("Desktop Metal", "MHD Log View", default_settings)
         self.ui = UI(settings=settings)
+        if '--live' in sys.argv[1:-1]:  # e.g. --live localhost:5555, rather than the address in the settings
+            self.ui.live_address = sys.argv[sys.argv.index('--live') + 1]
         sys.excepthook = self.exception_handler  # Qt apps don't give any info otherwise
 
     @staticmethod
@@ -115,6 +38,7 @@ class MHDLogView(QApplication):
 
     def run(self):
         self.ui.win.show()  # Show the UI
+        print('Window shown %.2f s after launch' % (perf_counter() - launched))
         self.ui.run()  # Execute the UI run script
         self.exec_()
 
@@ -132,15 +56,20 @@ class MHDLogView(QApplication):
             sys.exit(1)
 
 
-class GraphInit(FigureCanvas):
-    def __init__(self, parent=None):
-        fig = Figure()
-        self.axes = fig.add_subplot(111)
-        self.axes.grid()
-        super().__init__(fig)
-        self.setParent(parent)
-        # self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
-        # self.updateGeometry()
+def graph_init(parent=None):
+    # the plot area's canvas, with an empty grid until something is plotted
+    import matplotlib
+    matplotlib.use('Qt5Agg')
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    from matplotlib.figure import Figure
+    fig = Figure()
+    axes = fig.add_subplot(111)
+    axes.grid()
+    canvas = FigureCanvas(fig)
+    canvas.setParent(parent)
+    # canvas.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+    # canvas.updateGeometry()
+    return canvas
 
 
 class UI(object):
@@ -149,34 +78,73 @@ class UI(object):
         self.win = PyQt5.uic.loadUi(ui_path + '\\mhdlogviewGUI.ui')
         # self.filename = ui_path + '\\testJSON.txt'
         self.settings = settings
-        self.plotWin = GraphInit(self.win.plotWidget)
-        self.win.plotWidget.layout().addWidget(self.plotWin)
-        self.navBar = NavigationToolbar(self.plotWin, None)
-        self.win.plotWidget.layout().addWidget(self.navBar)
+        self.plotWin = None  # the plot area is filled in once the window is up (init_plot)
+        self.navBar = None
+        self.plotter = None  # keeps the axes and lines between refreshes
+        self.launched = launched  # until the first plot is drawn, to report how long that took
 
-        self.log_data = []  # what's in the file
-        self.info = None  # nozzle, material, etc.
-        self.signal_keys = []  # non-duplicate list of keys appearing in the log
-        self.event_list = []  # non-duplicate list of events that appear in the log
-        self.comment_indices = []  # list of indexes that contain a comment
-        self.comment_list = []  # list of the actual comment texts
-        self.plot_data = []  # what we're actually plotting based on user selections
+        self.model = LogSession()  # the loaded log(s); filled in on a worker thread
+        self.plot_data = {}  # what we're actually plotting based on user selections, one array per column
         self.plot_data_times = []
-        self.start_time = None  # a datetime representing start of run, used for x-axis
+        self.plot_rows = []  # which rows of log_data are in plot_data
+        self.worker = None  # the background job in progress, if any
+        self.job = None  # what it's doing: 'load', 'follow' or 'plot'
+        self.lists_shown = None  # the signals, events and comments in the lists
+        self.live = None  # a LiveFeed, when rows are pushed to us instead of read from the file
+        self.live_address = self.settings.value('live_address')
 
         self.filename = self.settings.value('last_used_file')
 
         self.win.timer = QTimer()
         self.win.timer.timeout.connect(self.reload_log_file)
+        self.win.live_timer = QTimer()
+        self.win.live_timer.timeout.connect(self.live_update)
 
     def run(self):
         self.init_ui()  # get initial values from the controllers
         self.attach_ui_connections()
         self.win.timer.start(20000)  # used for auto-update
+        if self.live_address:
+            self.start_live(self.live_address)
+        else:
+            self.preload()
+        QTimer.singleShot(0, self.init_plot)  # after the window has been drawn
+
+    def init_plot(self):
+        if self.plotter is not None:
+            return
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+        from plotter import LogPlotter
+        self.plotWin = graph_init(self.win.plotWidget)
+        self.win.plotWidget.layout().addWidget(self.plotWin)
+        self.navBar = NavigationToolbar(self.plotWin, None)
+        self.win.plotWidget.layout().addWidget(self.navBar)
+        self.plotter = LogPlotter(self.plotWin.figure)
+
+    def preload(self):
+        # reopens the last-used file in the background, so the last session's signals are plotted again without
+        # asking (from the file's parsed cache, if it has one)
+        filename = self.filename
+        if not filename or not os.path.isfile(filename):
+            return
+        print(f'Reopening {filename}')
+        self.win.txtLogFilename.setText(filename)
+        self.win.txtLogFilename.setToolTip(filename)
+        model = LogSession()
+        self.start_job('load', lambda date_range: self.preloaded(model, date_range), model.add, filename)
+
+    def preloaded(self, model, date_range):
+        self.model = model
+        if date_range:
+            self.win.dateTimeMin.setDateTime(date_range[0])
+            self.win.dateTimeMax.setDateTime(date_range[1])
+        self.update_ui(refresh=False)
+        if self.win.signalListWidget.selectedItems():  # the last session's signals, if the log still has them
+            self.refresh_plot()
 
     def init_ui(self):
         w = self.win
-        w.txtLogFilename.setText('Please select a log file to load')
+        w.txtLogFilename.setText('Please select a log file to load')  # (until preload() says otherwise)
         # w.txtLogFilename.setText(self.filename.split('/')[-1])  # just the file (no path)
 
     def attach_ui_connections(self):
@@ -188,9 +156,16 @@ class UI(object):
     def file_dialog(self):
         path = self.filename
         filename, _ = QFileDialog.getOpenFileName(None, 'Select Log File', path,
-                                                  "Text Files (*.txt);;All Files (*.*)")
+                                                  "Text Files (*.txt);;Compressed Logs (*.gz *.bz2 *.xz);;All Files (*.*)")
         if not filename:
             return
+        self.stop_live()  # (a file replaces the live feed, so there's nothing loaded to append to)
+        if self.win.chkAppend.isChecked() and filename in self.model:
+            answer = QMessageBox.question(None, 'Log File', '%s is already loaded. Remove it from the plot?\n'
+                                          '(No reads it again.)' % filename)
+            if answer == QMessageBox.Yes:
+                self.remove_log_file(filename)
+                return
 
         print(f'Opening {filename}')
         self.settings.setValue('last_used_file', filename)
@@ -201,113 +176,139 @@ class UI(object):
 
         self.load_log_file(filename)
 
+    def start_job(self, job, on_done, func, *args):
+        # runs func on a worker thread so the window stays responsive, cancelling whatever was running before
+        # on_done is called with its result back on the GUI thread
+        self.stop_job()
+        worker = Worker(func, *args)
+        worker.progress.connect(self.show_progress)
+        worker.done.connect(lambda result: self.job_finished(worker, on_done, result))
+        worker.failed.connect(lambda error: self.job_finished(worker, self.show_error, error))
+        self.worker = worker
+        self.job = job
+        worker.start()
+
+    def stop_job(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.end_job()
+
+    def end_job(self):
+        if self.job == 'load' and self.filename:
+            self.win.txtLogFilename.setText(self.filename)  # instead of the progress
+        self.worker = None
+        self.job = None
+
+    def job_finished(self, worker, on_done, result):
+        if worker is not self.worker:
+            return  # it finished just as it was cancelled
+        worker.wait()  # it has emitted its result, but the thread may not have quite ended
+        self.end_job()
+        on_done(result)
+
+    def show_progress(self, bytes_done, bytes_total, rows):
+        self.win.txtLogFilename.setText('%s  (loading %d%%, %d rows)' %
+                                        (self.filename, 100 * bytes_done // max(bytes_total, 1), rows))
+
+    @staticmethod
+    def show_error(error):
+        print(error)
+        msg = QMessageBox()
+        msg.setText(error.strip().splitlines()[-1])
+        msg.exec()
+
     def load_log_file(self, filename, reload=False):
+        # parsing happens on a worker thread; the lists and plot are updated when it's done
         append = self.win.chkAppend.isChecked()
-        self.process_file(filename, append, reload)
-        self.add_calculated_values()
+        model = self.model if append else LogSession()  # a cancelled load leaves the current logs alone
+        self.start_job('load', lambda date_range: self.log_file_loaded(model, date_range, append, reload),
+                       model.add, filename)
+
+    def log_file_loaded(self, model, date_range, append, reload):
+        # if reload = True, we don't want to reset the start time and ideally we wouldn't reset the zoom state either
+        self.model = model
+        if date_range and not reload and not append:
+            self.win.dateTimeMin.setDateTime(date_range[0])
+            self.win.dateTimeMax.setDateTime(date_range[1])
         self.update_ui()
 
-    def reload_log_file(self):
-        if not self.filename or not self.win.chkAutoUpdate.isChecked():
+    def remove_log_file(self, filename):
+        # the other files are already parsed, so this only merges them again
+        self.start_job('load', self.log_file_removed, self.model.remove, filename)
+
+    def log_file_removed(self, _):
+        files = self.model.files()
+        self.filename = files[-1] if files else None
+        self.win.txtLogFilename.setText(self.filename or 'Please select a log file to load')
+        if files:
+            self.update_ui()
             return
-        self.load_log_file(self.filename, reload=True)
+        for widget in (self.win.listEvents, self.win.listComments, self.win.signalListWidget):
+            widget.clear()
+        self.init_plot()
+        self.plotter.clear()
 
-    def process_file(self, filename, append=False, reload=False):
-        # if reload = True, we don't want to reset the start time and ideally we wouldn't reset the zoom state either
-        print('Processing file...')
-        new_log_data = self.read_file_by_line(filename)
-        if append:
-            self.log_data = self.log_data + new_log_data
-        else:
-            self.log_data = new_log_data
-
-        # at this point, log_data should be a List of Dicts -- one for each entry
-        if self.log_data[0].get('nozzle', None):
-            self.info = self.log_data[0]  # collects the metadata for use later
-
-        # get the start time -- it's the first time entry in the file
-        # (break below means we stop at the first date we find)
-        for line in self.log_data:
-            if 'time' in line and 'date' in line:
-                first_time = line['time']
-                first_date = line['date']
-                try:
-                    # 24-hour format
-                    self.start_time = datetime.strptime(first_time, '%H:%M:%S').time()
-                except ValueError:
-                    # 12-hour AM/PM format
-                    self.start_time = datetime.strptime(first_time, '%I:%M:%S %p').time()
-                start_date = datetime.strptime(first_date, '%Y%m%d').date()
-                start_datetime = datetime.combine(start_date, self.start_time)
-                end_datetime = datetime.combine(start_date, time().max)
-                if not reload and not append:
-                    self.win.dateTimeMin.setDateTime(start_datetime)
-                    self.win.dateTimeMax.setDateTime(end_datetime)
-                break
-
-        # parse file and retrieve keys, events, comment_indices
-        signal_keys = []
-        event_list = []
-        comments = []
-        for line_num, line in enumerate(self.log_data):
-            # Generate the list of signals
-            for key in line:
-                if key not in signal_keys and key not in forbidden_keys:
-                    signal_keys += [key]
-            # Process events:
-            event = line.get('event')
-            if event:
-                if "Comment:" in event:  # comments are moved to the comment list
-                    comments += [line_num]
-                    line['event_type'] = "Comment"
-                else:
-                    for e in shortened_events:  # condense events
-                        if e in event:
-                            event_type = e
-                            break
-                    else:
-                        event_type = event
-                    line['event_type'] = event_type
-
-                    # omit any events from the list that have their own subplot -- DISABLED WITH PASS
-                    for e in [x for v in special_plots.values() for x in v]:  # flattens the list of dict values
-                        if e in event:
-                            pass
-                            # break
-                    else:
-                        if event_type not in event_list:
-                            event_list += [event_type]
-        # comments:
-        self.comment_indices = comments  # used for lookup if user clicks comment in listbox
-        comment_list = []
-        for index in comments:
-            comment_list += [self.log_data[index]['event'][9:]]
-
-        self.comment_list = comment_list
-        self.event_list = sorted(event_list)
-        self.signal_keys = sorted(signal_keys)
-
-    def add_calculated_values(self):
-        if 'fdRatio' in self.signal_keys and 'drop_diam' not in self.signal_keys:
-            self.signal_keys += ['drop_diam']
-            for num, line in enumerate(self.log_data):
-                if 'fdRatio' in line:
-                    line['drop_diam'] = diam_from_volume(line['fdRatio'])
-                if line.get('event', None) and 'Triggered camera' in line['event']:
-                    # example: "Triggered camera, filename: 20180703-110254"
-                    fn = line['event'][28:]  # extracts filename
-                    # need to get speed from previous entry because illuminator stops nanny
-                    sp = self.log_data[num-1].get('average_speed', None)
-                    if sp == 0 or sp is None:
-                        sp = self.log_data[num-2].get('average_speed', None)
-                    freq = line['jet_freq']
-                    print('%s, %s, %s' % (fn, freq, sp))
-
-    def update_ui(self):
+    def reload_log_file(self):
+        if not self.filename or not self.win.chkAutoUpdate.isChecked() or self.live is not None:
+            return
+        if self.worker is not None:
+            return  # still busy with a load or refresh; the next tick will catch up
+        if self.filename not in self.model:
+            self.load_log_file(self.filename, reload=True)
+            return
+        self.start_job('follow', self.log_file_followed, self.model.follow)
+
+    def log_file_followed(self, result):
+        new_rows, lists_changed = result
+        if lists_changed:
+            self.update_ui()  # new keys, events or comments showed up
+        elif new_rows:
+            self.refresh_plot(keep_view=True)
+
+    def start_live(self, address):
+        # plots the rows sent to a local socket as they come in (the logger still writes the file)
+        from liveingest import LiveFeed, LiveModel
+        self.stop_job()
+        self.live = LiveFeed(address).start()
+        self.model = LiveModel(self.live)
+        self.win.txtLogFilename.setText('Live: %s' % address)
+        self.win.live_timer.start(live_interval)
+
+    def stop_live(self):
+        if self.live is None:
+            return
+        self.stop_job()
+        self.win.live_timer.stop()
+        self.live.stop()
+        self.live = None
+        self.model = LogSession()
+
+    def live_update(self):
+        if self.worker is not None:
+            return  # still busy; whatever arrives meanwhile waits in the feed
+        self.start_job('follow', self.live_followed, self.model.follow)
+
+    def live_followed(self, result):
+        new_rows, lists_changed = result
+        if not new_rows or self.model.time_range() is None:
+            return
+        date_range = self.model.date_range()  # the plot scrolls along with the rows kept
+        self.win.dateTimeMin.setDateTime(date_range[0])
+        self.win.dateTimeMax.setDateTime(date_range[1])
+        if lists_changed or self.lists_shown is None:
+            self.update_ui(refresh=False)
+        if self.win.signalListWidget.selectedItems():
+            self.refresh_plot(keep_view=True)
+
+    def shown_lists(self):
+        return list(self.model.signal_keys), list(self.model.event_list), list(self.model.comment_list)
+
+    def update_ui(self, refresh=True):
         # update the UI
-        event_list = self.event_list
-        comment_list = self.comment_list
-        signal_keys = self.signal_keys
+        event_list = self.model.event_list
+        comment_list = self.model.comment_list
+        signal_keys = self.model.signal_keys
+        self.lists_shown = self.shown_lists()
         w = self.win
         w.listEvents.clear()
         w.listEvents.addItems(event_list)
@@ -328,7 +329,8 @@ class UI(object):
                 for item in self.win.listEvents.findItems(key, PyQt5.QtCore.Qt.MatchExactly):
                     item.setSelected(True)
 
-        self.refresh_plot()
+        if refresh:
+            self.refresh_plot()
 
     # @staticmethod
     # def read_file(log_text):
@@ -339,26 +341,15 @@ class UI(object):
 
     @staticmethod
     def read_file_by_line(filename):
-        log_file = open(filename, 'r')
-        log_data = []
-        log_file.seek(0)
-        for line in log_file:
-            try:
-                data_in = json.loads(line)
-            except:
-                print('Could not process line: %s' % line)
-                continue  # skip this line and move on
-            else:
-                log_data.append(data_in)
-        log_file.close()
-        return log_data
-
-    def refresh_plot(self):
+        return LogTail(filename).read_new()
+
+    def refresh_plot(self, keep_view=False):
         # filename = self.filename
+        # keep_view is set by auto-update so a zoomed-in view isn't thrown away
         time_base = self.win.btnTimeBase.isChecked()
 
         # Make sure that a logfile has been loaded
-        if self.log_data is None:
+        if not len(self.model.log_data):
             msg = QMessageBox()
             msg.setText('No file loaded')
             msg.exec()
@@ -375,6 +366,7 @@ class UI(object):
 
         # Find which events to show
         desired_events = [x.text() for x in self.win.listEvents.selectedItems()]
+        from plotter import special_plots
         special_plots['Selected Events'] = desired_events
         self.settings.setValue('last_used_events', desired_events)  # save the plots for next time
 
@@ -382,251 +374,47 @@ class UI(object):
         skip_no_data = self.win.chkSkipNoData.isChecked()
         skip_no_jetting = self.win.chkSkipNoJetting.isChecked()
 
-        # Refresh the plot with desired signals
-        # print('Refreshing plot!')
-        self.plotWin.figure.clf()
-
-        self.generate_plot_data(desired_plots, skip_no_data, skip_no_jetting)
-
-        if self.plot_data:
-            self.generate_plot(desired_plots, time_base)
-
-    def generate_plot_data(self, desired_plots, skip_no_data=False, skip_no_jetting=False):
-        # make a list called 'plot_data' which contains only the data needed, with null placeholders
-        print('Generating plot data.')
-        self.plot_data = []
-        self.plot_data_times = []
-        index = 0
-        # TODO: speed this section up
+        if self.job in ('load', 'follow'):
+            return  # the plot is refreshed when that's done
         min_date_time = self.win.dateTimeMin.dateTime().toPyDateTime()
         max_date_time = self.win.dateTimeMax.dateTime().toPyDateTime()
-        for num, line in enumerate(self.log_data):
-            # bring in the x-axis data
-            date_time_string = line.get('date', '') + ' ' + line.get('time', '')
-            if len(date_time_string) == 1:  # no date/time data in this record --> ignore
-                continue
-            try:
-                date_time = datetime.strptime(date_time_string, '%Y%m%d %H:%M:%S')  # convert to datetime type
-            except ValueError:
-                date_time = datetime.strptime(date_time_string, '%m/%d/%Y %I:%M:%S %p')
-            # filter out values not within the requested range
-            if not min_date_time < date_time < max_date_time:
-                continue
-            time_as_num = matplotlib.dates.date2num(date_time)  # convert to number of days since epoch (for scale)
-            newline = {'event': line.get('event'), 'event_type': line.get('event_type'),
-                       # 'time': datetime.strptime(line['time'], '%H:%M:%S'),  # - self.start_time,
-                       'time': time_as_num,
-                       'odo': line.get('odo'),
-                       'drop_count': line.get('drop_count')}
-            # bring in user-selected data
-            if skip_no_data:
-                data_present = False  # flag so we don't include rows with no data
-            else:
-                data_present = True  # will always cause all rows to be included
-            for item in desired_plots:
-                value = line.get(item, None)
-                data_present = data_present or value  # one valid datum will set/leave this true
-                if item in only_while_jetting_signals:
-                    if value:
-                        value = value * line.get('jet_on', 1)  # don't show when not jetting
-                    else:
-                        value = None
-                if item in no_zero_signals and value == 0:
-                    value = None
-                if item not in ['event', 'time', 'odo', 'drop_count']:  # don't rewrite data already there
-                    newline[item] = value
-            # check for no jetting switch
-            if skip_no_jetting and not line.get('jet_on'):
-                data_present = False
-            # check for no data
-            if line.get('event'):  # always show any event
-                data_present = True
-            if data_present:
-                newline['index'] = index
-                index += 1
-                self.plot_data.append(newline)
-                self.plot_data_times.append(time_as_num)
-
-    def generate_plot(self, desired_plots, time_base=True):
-        print('Generating plot...')
-        # axis = object representing a lane in the graph shown to the user, usually contains one plot,
-        #        generated by the .subplot() routine below
-        # plot = a single parameter
-
-        # Go through the desired plots and make a list, combining as needed
-        drop_diam_axis = None
-        axes = []  # format: [[matplotlib axis], [plot1, plot2], height, [limits]]
-        for n, plot in enumerate(desired_plots):
-            # TODO: get rid of this kludge and make general solution for combined plots
-            if plot == 'drop_diam' or plot == 'drop_diam_calc':
-                if drop_diam_axis is not None:
-                    axes[drop_diam_axis][1].append(plot)
-                    continue  # skip making a new list item since we're just adding to an existing one
-                else:
-                    drop_diam_axis = n  # remember which plot has drop_diam (could be this one)
-            height = per_axis_heights.get(plot, default_height)
-            limits = per_axis_limits.get(plot)
-            axes.append([None, [plot], height, limits])
-        for _ in special_plots:
-            axes.append([None, [], 1, None])  # for selected events
-
-        # Create an axis set with required number of subplots:
-        num_plots = len(axes)
-        height_ratios = [x[2] for x in axes]
-
-        subplots = self.plotWin.figure.subplots(nrows=num_plots,
-                                                gridspec_kw={'height_ratios': height_ratios},
-                                                sharex=True)
-        for n, axis in enumerate(axes):
-            axis[0] = subplots[n]  # put the subplot object into the first position of each row in axes
-
-        # Populate the user's axes
-        print('Adding user axes...')
-        for axis in axes[:-len(special_plots)]:
-            for plot in axis[1]:  # list of plot names for this axis, usually only one
-                marker, marker_size = per_axis_markers.get(plot, ('.', 1))
-                if time_base:
-                    func = axis[0].plot_date
-                    x_data = [line['time'] for line in self.plot_data]
-                else:
-                    func = axis[0].plot
-                    x_data = [line['index'] for line in self.plot_data]
-                y_data = [line[plot] for line in self.plot_data]
-                func(x_data, y_data, linestyle='-', linewidth=1, marker=marker, markersize=marker_size, label=plot)
-            if axis[3]:  # y limits
-                axis[0].set_ylim(axis[3])
-            label = axis[1][0].replace('_', '\n')  # Replace underscores with line breaks
-            axis[0].set(ylabel=label)  # whatever the first plot is
-            axis[0].grid(which='both')
-
-        # add special plots
-        for num, plot in enumerate(special_plots):
-            # add the axis for user-selected events
-            print('Adding %s event plot...' % plot)
-            axis = axes[-(num+1)][0]
-            axis_limits = axis.get_ylim()
-            for line in self.plot_data:
-                ev = line.get('event_type')
-                # only include items selected in the list
-                if False:  # special case for user events:  plot == 'Selected Events':
-                    criteria = ev and ev in list()
-                else:
-                    # criteria = ev and ev in list(set(special_plots[plot]) & set(special_plots['Selected Events']))
-                    criteria = ev and ev in special_plots[plot]
-                if criteria:
-                    if time_base:
-                        line_time = line['time']  # matplotlib.dates.date2num(line['time'])
-                    else:
-                        line_time = line['index']
-                    line_formats = line_styles.get(ev, ['k', '-'])
-                    line_color, line_style = line_formats
-                    date_time = matplotlib.dates.num2date(line_time)
-                    nice_time = datetime.strftime(date_time, '%H:%M:%S')
-                    label = '%s\n%s\n%s' % (line.get('event'), nice_time, line.get('drop_count'))
-                    axis.vlines(line_time, axis_limits[0], axis_limits[1],
-                                colors=line_color, label=label, linestyles=line_style)
-            axis.set_ylabel(plot, rotation=0, size='xx-small')
-            y = axis.get_yaxis()
-            y.set_visible(True)
-            y.set_major_formatter(FuncFormatter(self.null_format_fn))  # gets rid of numbers
-            y.set_tick_params(which='both', left='off')
-            if num == 0:  # put the formatter on the last plot
-                axis.get_xaxis().set_major_formatter(FuncFormatter(self.format_fn))
-                axis.get_xaxis().set_major_locator(MaxNLocator(integer=True))
-
-        # add the pop-up balloons when you click
-        # TODO: find out why this calls the formatter many times for each subplot every time you click, and also when you dismiss the balloon
-        # for regular plots:
-        regular_plot_axes = subplots[:-(len(special_plots))]
-        datacursor(hover=False, axes=regular_plot_axes, display='single', draggable=False,
-                   formatter=self.datacursor_formatter)
-        # for special plots, all in info is in the label:
-        special_plot_axes = subplots[-(len(special_plots)):]
-        datacursor(hover=False, axes=special_plot_axes, display='single', draggable=False,
-                   formatter='{label}'.format)
-
-        # Add title and spacing, and draw figure
-        i = self.info
-        if i:
-            title_text = (
-                'Nozzle: %s   Material: %s   Operator: %s   Goal: %s   Notes: %s \n' % (
-                    i.get('nozzle'), i.get('material'),
-                    i.get('operator'), i.get('goal'),
-                    i.get('other notes')))
-        else:
-            title_text = ''
-        self.plotWin.figure.suptitle(title_text)
-
-        # gets the spacing right...ish
-        self.on_resize()
-        self.plotWin.figure.canvas.mpl_connect('resize_event', self.on_resize)
 
-        print('Drawing plot...')
-        self.plotWin.draw()
-        print('Done')
+        # Refresh the plot with desired signals
+        # print('Refreshing plot!')
+        self.start_job('plot', lambda result: self.plot_data_ready(result, desired_plots, time_base, keep_view),
+                       self.model.generate_plot_data, desired_plots, min_date_time, max_date_time, skip_no_data,
+                       skip_no_jetting)
+
+    def plot_data_ready(self, result, desired_plots, time_base, keep_view):
+        self.plot_data, self.plot_rows = result
+        self.plot_data_times = self.plot_data['time']
+        if self.shown_lists() != self.lists_shown:
+            self.update_ui(refresh=False)  # a wider time range read more of a big log
+        self.init_plot()
+        if len(self.plot_rows):
+            self.generate_plot(desired_plots, time_base, keep_view)
+        else:
+            self.plotter.clear()
 
-    def on_resize(self, *args):
-        # subplots_adjust using a percentage of the size, so get the size first
-        figure_width = self.plotWin.figure.get_figwidth()
-        self.plotWin.figure.subplots_adjust(left=.8/figure_width, right=.98, top=0.95, bottom=0.08, hspace=.02)
+    def generate_plot(self, desired_plots, time_base=True, keep_view=False):
+        self.plotter.plot(self.model.log_data, self.plot_data, self.plot_rows, desired_plots, time_base,
+                          self.model.info, keep_view, self.model.events)
+        if self.launched is not None:
+            print('First plot drawn %.2f s after launch' % (perf_counter() - self.launched))
+            self.launched = None
 
     def comment_click(self):
         cl = self.win.listComments
         if cl.selectedItems():
             # comment_text = cl.selectedItems().pop().text()
-            index = self.comment_indices[cl.currentRow()]
-            line = self.log_data[index]
+            index = self.model.events.comment_rows[cl.currentRow()]
+            log_data = self.model.log_data
+            import matplotlib.dates
+            date_time = matplotlib.dates.num2date(log_data.time[index])
             self.win.lblCommentInfo.setText('%s %s  Odo: %s   Drop Count: %s' %
-                                            (line['date'], line['time'], line['odo'], line['drop_count']))
-
-    @staticmethod
-    def datacursor_formatter(**kwargs):
-        # artist = kwargs['event'].artist
-        # print(artist)
-        x = kwargs['x']
-        y = kwargs['y']
-        date_time = matplotlib.dates.num2date(x)
-        nice_time = datetime.strftime(date_time, '%H:%M:%S')
-        return '%s = %s\n%s\n%s' % (kwargs['label'], y, nice_time, 'drops')
-
-    def format_fn(self, tick_val, tick_pos):
-        # format function; used to make custom x-axis labels
-        if self.win.btnTimeBase.isChecked():  # time-based plot, tick_val will be a time in days since epoch
-            # find closest entry to the tick mark's time
-            # TODO: this takes .01 - 7 sec and leaks memory -- can it be more efficient?
-            # TODO: maybe if we force the tick marks to be exact we don't need this
-            # then = time.perf_counter()
-            # index, closest_time = min(enumerate([line['time'] for line in self.plot_data]), key=lambda x: abs(x[1] - tick_val))
-            # time1 = time.perf_counter() - then
-            then = perf_counter()
-            index, closest_time = min(enumerate([t for t in self.plot_data_times]), key=lambda x: abs(x[1] - tick_val))
-            time2 = perf_counter() - then
-            # print(tick_val, time2)
-            error_sec = abs(tick_val - self.plot_data[index]['time']) * 3600 * 24
-            if error_sec > 2:  # don't grab data that's off by more than two seconds
-                date_time = matplotlib.dates.num2date(tick_val)
-                return datetime.strftime(date_time, '%H:%M')
-        else:  # index-based plot, tick_val will be the data log entry number
-            index = int(tick_val)
-        if index and 0 <= index <= len(self.plot_data):
-            line = self.plot_data[index]
-            # et = datetime.strptime(line['time'], '%H:%M:%S') - self.start_time
-            date_time = matplotlib.dates.num2date(line['time'])
-            closest_time = datetime.strftime(date_time, '%H:%M:%S')
-            return '%s\n %s\n %s' % (closest_time, line['odo'], line['drop_count'])
-        else:
-            return ''
-
-    @staticmethod
-    def null_format_fn(*args):
-        return ''
-
-
-def diam_from_volume(drop_volume_nl):
-    """returns drop diameter in microns given drop volume in nL"""
-    drop_volume_mm3 = drop_volume_nl / 1000
-    drop_diam_um = round(1000 * ((drop_volume_mm3/(4/3*math.pi))**(1/3))*2)  # x1000 for microns
-    return drop_diam_um
+                                            (datetime.strftime(date_time, '%Y%m%d'),
+                                             datetime.strftime(date_time, '%H:%M:%S'),
+                                             log_data.value('odo', index), log_data.value('drop_count', index)))
 
 
 if __name__ == '__main__':
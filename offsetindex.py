@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import numpy as np
+from logfile import open_log, log_size
+from ingest import last_line_end
+
+
+index_version = 1
+default_spacing = 10000  # lines between samples
+head_size = 4096  # bytes hashed at the start of the log, to notice it being replaced
+block_size = 4 * 2**20
+
+
+class OffsetIndex(object):
+    """the time and byte offset of every spacing'th line of a log, kept next to it (<log>.offsets) and extended
+    as it grows, so the lines of a time window can be found without parsing the rest. time_of(line) gives a
+    line's matplotlib date number, or None for lines without one (those are passed over for the next)."""
+    def __init__(self, filename, time_of, spacing=default_spacing):
+        self.filename = filename
+        self.path = os.path.abspath(filename) + '.offsets'
+        self.time_of = time_of
+        self.spacing = spacing
+        self.reset()
+
+    def reset(self):
+        self.offsets = []  # byte offset of each sampled line
+        self.times = []  # and its time
+        self.end = 0  # where indexing got to (the start of a line)
+        self.lines = 0  # lines since the last sample
+        self.head = None  # digest of the first head_length bytes
+        self.head_length = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def digest(self, length):
+        with open_log(self.filename) as log_file:
+            return hashlib.sha1(log_file.read(length)).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as index_file:
+                meta = json.load(index_file)
+        except (OSError, ValueError):
+            return False
+        if meta.get('version') != index_version or meta.get('spacing') != self.spacing:
+            return False
+        self.offsets = meta['offsets']
+        self.times = meta['times']
+        self.end = meta['end']
+        self.lines = meta['lines']
+        self.head = meta['head']
+        self.head_length = meta['head_length']
+        return True
+
+    def save(self):
+        meta = {'version': index_version, 'spacing': self.spacing, 'offsets': self.offsets, 'times': self.times,
+                'end': self.end, 'lines': self.lines, 'head': self.head, 'head_length': self.head_length}
+        try:
+            with open(self.path + '.tmp', 'w') as index_file:
+                json.dump(meta, index_file)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            print('Could not write offset index %s: %s' % (self.path, e))
+
+    def update(self):
+        # indexes whatever was appended since last time, or starts over if the log was replaced; returns self
+        if self.load() and (self.end > log_size(self.filename) or self.digest(self.head_length) != self.head):
+            self.reset()
+        end = last_line_end(self.filename)
+        if end <= self.end:
+            return self
+        print('Indexing offsets of %s...' % self.filename)
+        with open_log(self.filename) as log_file:
+            position = self.end
+            while position < end:
+                log_file.seek(position)
+                block = log_file.read(min(block_size, end - position))
+                newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+                if not len(newlines):  # a line longer than a block
+                    block += log_file.readline()
+                    newlines = np.array([len(block) - 1])
+                self.sample(block, position, newlines)
+                position += int(newlines[-1]) + 1
+        self.end = end
+        if self.head_length < head_size:
+            self.head_length = min(head_size, end)
+            self.head = self.digest(self.head_length)
+        self.save()
+        return self
+
+    def sample(self, block, position, newlines):
+        # records the lines of block (which starts at byte position) that are due to be sampled
+        starts = np.concatenate([[0], newlines[:-1] + 1])
+        line = 0
+        while line < len(starts):
+            if self.offsets and self.lines < self.spacing:
+                skip = min(self.spacing - self.lines, len(starts) - line)
+                self.lines += skip
+                line += skip
+                continue
+            time = self.time_of(block[starts[line]:newlines[line]])
+            if time is not None and not np.isnan(time):
+                self.offsets.append(position + int(starts[line]))
+                self.times.append(float(time))
+                self.lines = 0
+            self.lines += 1
+            line += 1
+
+    def ordered(self):
+        # the samples only bound a window if the log's times never go backwards
+        return not np.any(np.diff(self.times) < 0)
+
+    def window(self, t_min, t_max):
+        # (start, end) byte offsets of the lines that may have t_min <= time <= t_max; end is None if they may run
+        # to the end of the log. None if the samples can't tell.
+        if not self.offsets or not self.ordered():
+            return None
+        times = np.array(self.times)
+        first = np.searchsorted(times, t_min, side='left') - 1  # the last sample before t_min
+        last = np.searchsorted(times, t_max, side='right')  # the first sample after t_max
+        start = self.offsets[first] if first >= 0 else 0
+        end = self.offsets[last] if last < len(times) else None
+        return start, end
@@ -0,0 +1,382 @@
+from datetime import datetime
+import matplotlib.dates
+from matplotlib.collections import LineCollection
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+from decimate import LevelOfDetail
+from timeindex import TimeIndex
+from eventindex import EventIndex
+import instrument
+from instrument import trace, span
+
+
+# the are custom settings for the various quantities plotted.  These are defaults, the user can change them.
+per_axis_limits = {'average_speed': (1, 2.5),
+                   'stream_angle': (0, 20),
+                   'angle_compound': (0, 10),
+                   'angle_front': (-10, 10),
+                   'angle_side': (-10, 10),
+                   'front_angle': (-10, 10),
+                   'side_angle': (-10, 10),
+                   # 'reservoir_temp': (650, 800),
+                   'nozzle_setpoint': (650, 750),
+                   # 'nozzle_temp': (650, 750),
+                   # 'terminal_temp': (500, 580),
+                   'table_temp': (630, 700),
+                   # 'temp3': (630, 700),
+                   # 'neg_pw': (0, 250),
+                   # 'pos_pw': (50, 200),
+                   # 'jet_freq': (0, 200),
+                   'variance': (-.01, .5),
+                   'jitter': (-.01, .1),
+                   # 'o2_ppm': (0, 10),
+                   'moisture_ppm_in_v': (0, 10),
+                   'box_pressure': (0, 5),
+                   'pulse_delay': (0, 200),
+                   'drop_diam': (380, 410),
+                   'drop_diam_calc': (150, 500)
+                   }
+
+per_axis_markers = {'drop_diam_calc': ('x', 4),
+                    }
+
+default_height = 6  # proportional height of normal plots
+per_axis_heights = {'jet_on': 1}
+
+line_styles = {'Triggered camera': ['.80', '-'],
+               'Nozzle clean': ['y', '-'],
+               'Wire through nozzle orifice': ['y', '-'],
+               'Clog': ['r', '-'],
+               'Scraped bottom of nozzle face': ['b', '-'],
+               'Dross vacuum (manual)': ['g', '-'],
+               'Wiped dross from top of reservoir': ['g', '-'],
+               'Starting torture test': ['g', '-'],
+               'Torture test paused': ['r', '--'],
+               'Torture test resumed': ['g', '--'],
+               'Aborting torture test': ['r', '-'],
+               'Comment': ['k', '-'],
+               }
+
+key_sets = [['drop_diam', 'drop_diam_calc'],
+            ['nozzle_setpoint', 'nozzle_temp']]  # for future use, forces keys into one chart
+
+# the following get their own graphs so they don't need to show up in the UI event list
+special_plots = {'Nozzle service': ['Nozzle purge', 'Nozzle service: wipe', 'Move to wipe position',
+                                    'Wiped dross from top of reservoir',
+                                    'Scraped bottom of nozzle face', 'Dross vacuum (manual)',
+                                    'Nozzle service: weigh drops', 'Nozzle service: free jet'],
+                 'Torture test': ['Torture test paused', 'Torture test resumed', 'Aborting torture test',
+                                  'Starting torture test', 'Torture test completed'],
+                 'Comments/videos': ['Comment', 'Triggered camera'],
+                 'Selected Events': []  # filled in later
+                 }
+
+
+class LogPlotter(object):
+    """draws plot_data into a figure. The axes and artists are kept between calls, so when the selected signals
+    haven't changed a refresh only swaps the data in (and keeps the user's zoom).
+    With interactive=True (the GUI) the data artists are animated and updates are blitted, and clicking shows
+    datacursor balloons; use interactive=False to render to a file."""
+    def __init__(self, figure, interactive=True):
+        self.figure = figure
+        self.interactive = interactive
+        self.layout = None  # (desired plots, time base) the current axes were built for
+        self.axes = []  # format: [[matplotlib axis], [plot1, plot2], height, [limits]]
+        self.lines = {}  # plot name -> Line2D
+        self.lanes = {}  # special plot name -> LineCollection of event markers
+        self.lane_events = {}  # LineCollection -> (TimeIndex of the marker positions, labels)
+        self.lod = LevelOfDetail()
+        self.auto_xlim = None  # the x-limits autoscaling gave; anything else means the user zoomed or panned
+        self.background = None  # the figure without its animated artists, for blitting
+
+        self.log_data = None
+        self.events = None  # the log's EventIndex
+        self.plot_data = {}
+        self.plot_rows = []
+        self.time_base = True
+        self.plot_time_index = TimeIndex([])  # nearest-sample lookup into plot_data
+        self.tick_labels = {}  # formatted x-axis labels by tick value, cleared with plot_data
+
+        figure.canvas.mpl_connect('resize_event', self.on_resize)
+        if interactive:
+            figure.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def clear(self):
+        self.figure.clf()
+        self.layout = None
+        self.figure.canvas.draw_idle()
+
+    def plot(self, log_data, plot_data, plot_rows, desired_plots, time_base=True, info=None, keep_view=False,
+             events=None):
+        # keep_view: an auto-update, so leave the x-limits alone if the user has zoomed or panned
+        # events: the log's EventIndex, if it has one
+        with trace('plot', rows=len(plot_rows)):
+            self.log_data = log_data
+            self.events = events if events is not None else EventIndex.of(log_data)
+            self.plot_data = plot_data
+            self.plot_rows = plot_rows
+            self.time_base = time_base
+            self.plot_time_index = TimeIndex(plot_data['time'])
+            self.tick_labels = {}
+            layout = (tuple(desired_plots), time_base)
+            if layout != self.layout:
+                with span('build', 'Generating plot...'):
+                    self.build(desired_plots, info)
+                self.layout = layout
+            else:
+                with span('update', 'Updating plot...'):
+                    self.set_title(info)
+                    self.update(keep_view)
+
+    def build(self, desired_plots, info=None):
+        # axis = object representing a lane in the graph shown to the user, usually contains one plot,
+        #        generated by the .subplot() routine below
+        # plot = a single parameter
+        self.figure.clf()
+        self.lod = LevelOfDetail()
+        self.lines = {}
+        self.lanes = {}
+        self.lane_events = {}
+
+        # Go through the desired plots and make a list, combining as needed
+        drop_diam_axis = None
+        axes = []  # format: [[matplotlib axis], [plot1, plot2], height, [limits]]
+        for n, plot in enumerate(desired_plots):
+            # TODO: get rid of this kludge and make general solution for combined plots
+            if plot == 'drop_diam' or plot == 'drop_diam_calc':
+                if drop_diam_axis is not None:
+                    axes[drop_diam_axis][1].append(plot)
+                    continue  # skip making a new list item since we're just adding to an existing one
+                else:
+                    drop_diam_axis = n  # remember which plot has drop_diam (could be this one)
+            height = per_axis_heights.get(plot, default_height)
+            limits = per_axis_limits.get(plot)
+            axes.append([None, [plot], height, limits])
+        for _ in special_plots:
+            axes.append([None, [], 1, None])  # for selected events
+        self.axes = axes
+
+        # Create an axis set with required number of subplots:
+        num_plots = len(axes)
+        height_ratios = [x[2] for x in axes]
+
+        subplots = self.figure.subplots(nrows=num_plots, gridspec_kw={'height_ratios': height_ratios}, sharex=True)
+        for n, axis in enumerate(axes):
+            axis[0] = subplots[n]  # put the subplot object into the first position of each row in axes
+
+        # Populate the user's axes
+        with span('user axes', 'Adding user axes...'):
+            for axis in axes[:-len(special_plots)]:
+                for plot in axis[1]:  # list of plot names for this axis, usually only one
+                    marker, marker_size = per_axis_markers.get(plot, ('.', 1))
+                    func = axis[0].plot_date if self.time_base else axis[0].plot
+                    # an empty line; the level-of-detail engine fills in a decimated copy of the data
+                    line, = func([], [], linestyle='-', linewidth=1, marker=marker, markersize=marker_size,
+                                 label=plot)
+                    line.set_animated(self.interactive)
+                    self.lines[plot] = (axis[0], line)
+                if axis[3]:  # y limits
+                    axis[0].set_ylim(axis[3])
+                label = axis[1][0].replace('_', '\n')  # Replace underscores with line breaks
+                axis[0].set(ylabel=label)  # whatever the first plot is
+                axis[0].grid(which='both')
+
+        # add special plots, one LineCollection of event markers each
+        with span('special plots'):
+            for num, plot in enumerate(special_plots):
+                with span('event plot %s' % plot, 'Adding %s event plot...' % plot):
+                    axis = axes[-(num+1)][0]
+                    lane = LineCollection([], linewidths=1, animated=self.interactive)
+                    axis.add_collection(lane)
+                    axis.set_ylim(0, 1)
+                    self.lanes[plot] = lane
+                    axis.set_ylabel(plot, rotation=0, size='xx-small')
+                    y = axis.get_yaxis()
+                    y.set_visible(True)
+                    y.set_major_formatter(FuncFormatter(self.null_format_fn))  # gets rid of numbers
+                    y.set_tick_params(which='both', left=False)
+                    if num == 0:  # put the formatter on the last plot
+                        axis.get_xaxis().set_major_formatter(FuncFormatter(self.format_fn))
+                        axis.get_xaxis().set_major_locator(MaxNLocator(integer=True))
+
+        self.set_data()
+        self.autoscale()
+
+        if self.interactive:
+            from mpldatacursor import datacursor
+            # add the pop-up balloons when you click
+            # TODO: find out why this calls the formatter many times for each subplot every time you click, and also when you dismiss the balloon
+            # for regular plots:
+            regular_plot_axes = subplots[:-(len(special_plots))]
+            datacursor(hover=False, axes=regular_plot_axes, display='single', draggable=False,
+                       formatter=self.datacursor_formatter)
+            # for special plots, the info comes from the event nearest the click:
+            special_plot_axes = subplots[-(len(special_plots)):]
+            datacursor(hover=False, axes=special_plot_axes, display='single', draggable=False,
+                       formatter=self.event_formatter)
+
+        self.set_title(info)
+
+        # gets the spacing right...ish
+        self.on_resize()
+
+        with span('draw', 'Drawing plot...'):
+            self.figure.canvas.draw()
+
+    def update(self, keep_view=False):
+        # same signals as last time: swap the new data into the existing artists
+        user_zoomed = keep_view and tuple(self.axes[0][0].get_xlim()) != self.auto_xlim
+        self.set_data()
+        if user_zoomed:
+            self.lod.update_all()  # re-decimate the window the user is looking at
+            self.blit()
+        else:
+            self.autoscale()  # follow the data as it grows
+            if instrument.enabled:
+                with span('draw'):  # draw now rather than when idle, so the trace shows how long it takes
+                    self.figure.canvas.draw()
+            else:
+                self.figure.canvas.draw_idle()
+
+    def set_data(self):
+        plot_data = self.plot_data
+        x_data = plot_data['time'] if self.time_base else plot_data['index']
+        for plot, (axis, line) in self.lines.items():
+            with span('axis %s' % plot, rows=len(x_data)):
+                self.lod.add(axis, line, x_data, plot_data[plot])
+
+        # event markers: a vertical line in the lane for each event of the lane's types
+        log_data = self.log_data
+        for plot, lane in self.lanes.items():
+            with span('lane %s' % plot) as lane_span:
+                lane_codes = log_data.category_codes('event_type', special_plots[plot])
+                num_rows = self.events.positions_in(lane_codes, self.plot_rows)  # (just the lane's events)
+                lane_span.count(len(num_rows))
+                segments, colors, styles, labels = [], [], [], []
+                for num_row in num_rows:
+                    row = self.plot_rows[num_row]
+                    ev = log_data.category('event_type', row)
+                    line_color, line_style = line_styles.get(ev, ['k', '-'])
+                    date_time = matplotlib.dates.num2date(plot_data['time'][num_row])
+                    nice_time = datetime.strftime(date_time, '%H:%M:%S')
+                    segments.append([(x_data[num_row], 0), (x_data[num_row], 1)])
+                    colors.append(line_color)
+                    styles.append(line_style)
+                    labels.append('%s\n%s\n%s' % (log_data.category('event', row), nice_time,
+                                                  log_data.value('drop_count', row)))
+                lane.set_segments(segments)
+                if segments:
+                    lane.set_color(colors)
+                    lane.set_linestyle(styles)
+                self.lane_events[lane] = (TimeIndex(x_data[num_rows]), labels)
+
+    def autoscale(self):
+        for axis in self.axes[:-len(special_plots)]:
+            axis[0].relim()
+            axis[0].autoscale_view()  # leaves alone any y-limits set from per_axis_limits
+        self.auto_xlim = tuple(self.axes[0][0].get_xlim())
+
+    def animated_artists(self):
+        return [line for axis, line in self.lines.values()] + list(self.lanes.values())
+
+    def on_draw(self, event):
+        # a full draw leaves the animated artists out: keep that as the background, then draw them on top
+        canvas = self.figure.canvas
+        if canvas.is_saving():
+            return  # savefig draws everything, and PDF/SVG canvases can't copy a region anyway
+        self.background = canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self.animated_artists():
+            self.figure.draw_artist(artist)
+
+    def blit(self):
+        # redraw just the data artists over the saved background; limits and ticks haven't changed
+        canvas = self.figure.canvas
+        if self.background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        for artist in self.animated_artists():
+            self.figure.draw_artist(artist)
+        canvas.blit(self.figure.bbox)
+
+    def set_title(self, info):
+        # Add title
+        i = info
+        if i:
+            title_text = (
+                'Nozzle: %s   Material: %s   Operator: %s   Goal: %s   Notes: %s \n' % (
+                    i.get('nozzle'), i.get('material'),
+                    i.get('operator'), i.get('goal'),
+                    i.get('other notes')))
+        else:
+            title_text = ''
+        self.figure.suptitle(title_text)
+
+    def on_resize(self, *args):
+        # subplots_adjust using a percentage of the size, so get the size first
+        figure_width = self.figure.get_figwidth()
+        self.figure.subplots_adjust(left=.8/figure_width, right=.98, top=0.95, bottom=0.08, hspace=.02)
+        self.lod.update_all()  # the axes' pixel widths changed
+
+    def datacursor_formatter(self, **kwargs):
+        # artist = kwargs['event'].artist
+        # print(artist)
+        x = kwargs['x']
+        y = kwargs['y']
+        index = self.plot_index(x)
+        if index is not None:
+            x = self.plot_data['time'][index]
+            drops = self.log_data.value('drop_count', self.plot_rows[index])
+        else:
+            drops = None
+        date_time = matplotlib.dates.num2date(x)
+        nice_time = datetime.strftime(date_time, '%H:%M:%S')
+        return '%s = %s\n%s\n%s drops' % (kwargs['label'], y, nice_time, drops)
+
+    def event_formatter(self, **kwargs):
+        # all the info for an event marker is in its label
+        event_index, labels = self.lane_events.get(kwargs['event'].artist, (TimeIndex([]), []))
+        index = event_index.nearest(kwargs['x'])
+        return labels[index] if index is not None else ''
+
+    def plot_index(self, x):
+        # position in plot_data of the sample at x (a time or an index, depending on the x-axis)
+        if self.time_base:
+            return self.plot_time_index.nearest(x)
+        index = int(round(x))
+        return index if 0 <= index < len(self.plot_rows) else None
+
+    def format_fn(self, tick_val, tick_pos):
+        # format function; used to make custom x-axis labels
+        # matplotlib calls this for every tick on every redraw, so labels are cached until plot_data changes
+        label = self.tick_labels.get(tick_val)
+        if label is None:
+            if len(self.tick_labels) > 1000:
+                self.tick_labels.clear()
+            label = self.tick_labels[tick_val] = self.tick_label(tick_val)
+        return label
+
+    def tick_label(self, tick_val):
+        if self.time_base:  # time-based plot, tick_val will be a time in days since epoch
+            # find closest entry to the tick mark's time
+            # TODO: maybe if we force the tick marks to be exact we don't need this
+            index = self.plot_time_index.nearest(tick_val)
+            if index is None:
+                return ''
+            error_sec = abs(tick_val - self.plot_data['time'][index]) * 3600 * 24
+            if error_sec > 2:  # don't grab data that's off by more than two seconds
+                date_time = matplotlib.dates.num2date(tick_val)
+                return datetime.strftime(date_time, '%H:%M')
+        else:  # index-based plot, tick_val will be the data log entry number
+            index = int(tick_val)
+        if index and 0 <= index < len(self.plot_rows):
+            row = self.plot_rows[index]
+            date_time = matplotlib.dates.num2date(self.plot_data['time'][index])
+            closest_time = datetime.strftime(date_time, '%H:%M:%S')
+            return '%s\n %s\n %s' % (closest_time, self.log_data.value('odo', row),
+                                       self.log_data.value('drop_count', row))
+        else:
+            return ''
+
+    @staticmethod
+    def null_format_fn(*args):
+        return ''
@@ -0,0 +1,238 @@
+import os
+import json
+import shutil
+import numpy as np
+import matplotlib.dates as mdates
+from loader import RunDetector, read_records
+from ingest import ParseErrors
+from logfile import log_size
+from intervals import as_seconds, on_time_before
+
+
+rollup_version = 1
+# (name, bin width in seconds, offset of the bin edges from the epoch) -- weeks start on Monday 1970-01-05
+levels = [('minute', 60, 0), ('hour', 3600, 0), ('day', 86400, 0), ('week', 7 * 86400, 4 * 86400)]
+batch_size = 100000  # runs added to the rollups at a time while reading the log
+
+epoch = mdates.date2num(np.datetime64('1970-01-01T00:00:00'))
+
+
+def to_datenum(seconds):
+    # seconds since the epoch -> matplotlib date numbers
+    return np.asarray(seconds) / 86400 + epoch
+
+
+def to_seconds(datenum):
+    return (np.asarray(datenum) - epoch) * 86400
+
+
+class Rollup(object):
+    """on-time seconds and run starts of each channel in fixed-width time bins"""
+    def __init__(self, name, width, offset, n_channels):
+        self.name = name
+        self.width = width
+        self.offset = offset
+        self.first = None  # bin number of row 0
+        self.on = np.zeros((0, n_channels))
+        self.starts = np.zeros((0, n_channels), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.on)
+
+    def bin_of(self, seconds):
+        return (np.asarray(seconds) - self.offset) // self.width
+
+    def edges(self, first_row=0, stop_row=None):
+        # bin edges in seconds since the epoch
+        stop_row = len(self) if stop_row is None else stop_row
+        return (self.first + np.arange(first_row, stop_row + 1)) * self.width + self.offset
+
+    def fraction(self, first_row=0, stop_row=None):
+        return self.on[first_row:stop_row] / self.width
+
+    def add(self, channels, starts, ends):
+        # adds completed runs (epoch seconds); returns the first row that changed
+        if not len(channels):
+            return len(self)
+        low = int(self.bin_of(starts.min()))
+        high = int(self.bin_of(ends.max())) + 1
+        if self.first is None:
+            self.first = low
+        touched = low - self.first
+        if touched < 0:  # a run from before anything we had, e.g. one that was on since the log started
+            self.on = np.concatenate([np.zeros((-touched, self.on.shape[1])), self.on])
+            self.starts = np.concatenate([np.zeros((-touched, self.on.shape[1]), dtype=np.int32), self.starts])
+            self.first = low
+            touched = 0
+        if high - self.first > len(self):
+            grow = high - self.first - len(self)
+            self.on = np.concatenate([self.on, np.zeros((grow, self.on.shape[1]))])
+            self.starts = np.concatenate([self.starts, np.zeros((grow, self.on.shape[1]), dtype=np.int32)])
+        edges = self.edges(touched, high - self.first)
+        for cn in np.unique(channels):
+            mine = channels == cn
+            order = np.argsort(starts[mine], kind='stable')
+            run_starts, run_ends = starts[mine][order], ends[mine][order]
+            self.on[touched:high - self.first, cn] += np.diff(on_time_before(run_starts, run_ends, edges))
+            self.starts[touched:high - self.first, cn] += np.diff(np.searchsorted(run_starts, edges))
+        return touched
+
+
+class RollupStore(object):
+    """every completed run of a FurnaceDAQ log plus its duty-cycle pyramid, kept in a sidecar directory
+    (<log>.rollup/) and brought up to date by reading only what was appended since last time"""
+    def __init__(self, filename, n_channels=8):
+        self.filename = os.path.abspath(filename)
+        self.path = self.filename + '.rollup'
+        self.n_channels = n_channels
+        self.reset()
+
+    def reset(self):
+        self.detector = RunDetector(self.n_channels)
+        self.runs = np.zeros((0, 3), dtype=np.int64)  # channel, start, end (epoch seconds)
+        self.levels = [Rollup(name, width, offset, self.n_channels) for name, width, offset in levels]
+
+    def file_path(self, name):
+        return os.path.join(self.path, name)
+
+    def load(self):
+        try:
+            with open(self.file_path('meta.json'), 'r') as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return False
+        if meta.get('version') != rollup_version or not meta.get('complete'):
+            return False  # an older format, or a save that was interrupted
+        self.detector = RunDetector.from_checkpoint(meta['checkpoint'])
+        self.runs = np.fromfile(self.file_path('runs.i8'), dtype=np.int64).reshape(-1, 3)[:meta['runs']]
+        for level in self.levels:
+            rows = meta['levels'][level.name]['rows']
+            level.first = meta['levels'][level.name]['first']
+            level.on = np.fromfile(self.file_path(level.name + '.on.f8')).reshape(-1, self.n_channels)[:rows]
+            level.starts = np.fromfile(self.file_path(level.name + '.starts.i4'),
+                                       dtype=np.int32).reshape(-1, self.n_channels)[:rows]
+        return True
+
+    def update(self):
+        # reads the runs completed since the last update into the pyramid and saves the rows that changed
+        if not self.load() or self.detector.offset > log_size(self.filename):
+            self.reset()
+            shutil.rmtree(self.path, ignore_errors=True)
+        old_runs = len(self.runs)
+        touched = [len(level) for level in self.levels]
+        errors = ParseErrors()
+        batch = []
+        for cn, start, end in self.detector.runs(read_records(self.filename, self.detector.offset, errors)):
+            batch.append((cn, as_seconds(start), as_seconds(end)))
+            if len(batch) >= batch_size:
+                touched = self.add(batch, touched)
+                batch = []
+        touched = self.add(batch, touched)
+        errors.report(self.filename)
+        self.save(old_runs, touched)
+        print('%d new runs in %s' % (len(self.runs) - old_runs, self.filename))
+
+    def add(self, batch, touched):
+        if not batch:
+            return touched
+        batch = np.array(batch, dtype=np.int64).reshape(-1, 3)
+        self.runs = np.concatenate([self.runs, batch])
+        return [min(row, level.add(batch[:, 0], batch[:, 1], batch[:, 2]))
+                for row, level in zip(touched, self.levels)]
+
+    def save(self, old_runs, touched):
+        # appends the new runs and rewrites each level from its first changed row
+        meta = {'version': rollup_version, 'complete': False, 'checkpoint': self.detector.checkpoint(),
+                'runs': len(self.runs),
+                'levels': {level.name: {'first': level.first, 'rows': len(level)} for level in self.levels}}
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            self.write_meta(meta)  # marks the files as being written, in case we're interrupted
+            self.write_rows('runs.i8', self.runs, old_runs)
+            for level, row in zip(self.levels, touched):
+                self.write_rows(level.name + '.on.f8', level.on, row)
+                self.write_rows(level.name + '.starts.i4', level.starts, row)
+            meta['complete'] = True
+            self.write_meta(meta)
+        except OSError as e:
+            print('Could not write rollups %s: %s' % (self.path, e))
+
+    def write_meta(self, meta):
+        with open(self.file_path('meta.json.tmp'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(self.file_path('meta.json.tmp'), self.file_path('meta.json'))
+
+    def write_rows(self, name, array, first):
+        path = self.file_path(name)
+        first = first if os.path.exists(path) else 0
+        row_bytes = array.itemsize * (array.shape[1] if array.ndim > 1 else 1)
+        with open(path, 'r+b' if first else 'wb') as array_file:
+            array_file.truncate(first * row_bytes)
+            array_file.seek(first * row_bytes)
+            array[first:].tofile(array_file)
+
+    def open_runs(self):
+        # runs still going at the end of the log, as (channel, start, end) epoch seconds
+        return np.array([(cn, as_seconds(start), as_seconds(end)) for cn, start, end in self.detector.open_runs()],
+                        dtype=np.int64).reshape(-1, 3)
+
+    def totals(self):
+        # on-time seconds of each channel, including runs that haven't finished yet
+        open_runs = self.open_runs()
+        return (self.levels[-1].on.sum(axis=0) +
+                np.bincount(open_runs[:, 0], weights=open_runs[:, 2] - open_runs[:, 1], minlength=self.n_channels))
+
+
+class DutyCycleChart(object):
+    """channel activity on a date axis: the individual runs when few enough are in view, otherwise the
+    duty cycle of the finest rollup level that fits, so the cost of a redraw doesn't grow with the span shown"""
+    max_runs = 2000
+    max_bins = 1500
+
+    def __init__(self, ax, store, channel_names, color='crimson'):
+        self.ax = ax
+        self.store = store
+        self.color = color
+        self.artists = []
+        self.level = None  # the rollup shown, or None when showing runs
+        runs = np.concatenate([store.runs, store.open_runs()])
+        self.runs = runs[np.argsort(runs[:, 1], kind='stable')]
+        ax.set_yticks(range(len(channel_names)))
+        ax.set_yticklabels(channel_names)
+        ax.set_ylim(-0.5, len(channel_names) - 0.5)
+        ax.xaxis_date()
+        if len(self.runs):
+            ax.set_xlim(to_datenum(self.runs[:, 1].min()), to_datenum(self.runs[:, 2].max()))
+        ax.callbacks.connect('xlim_changed', self.redraw)
+        self.redraw(ax)
+
+    def redraw(self, ax):
+        low, high = to_seconds(sorted(ax.get_xlim()))
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+        runs = self.runs[:np.searchsorted(self.runs[:, 1], high)]  # sorted by start
+        runs = runs[runs[:, 2] > low]
+        if len(runs) <= self.max_runs:
+            self.level = None
+            for cn in np.unique(runs[:, 0]):
+                mine = runs[runs[:, 0] == cn]
+                bars = list(zip(to_datenum(mine[:, 1]), (mine[:, 2] - mine[:, 1]) / 86400))
+                self.artists.append(ax.broken_barh(bars, (cn - 0.4, 0.8), color=self.color))
+            return
+        self.level = self.store.levels[-1]
+        for level in self.store.levels:
+            if (high - low) / level.width <= self.max_bins:
+                self.level = level
+                break
+        level = self.level
+        first = max(0, int(level.bin_of(low)) - level.first)
+        stop = min(len(level), int(level.bin_of(high)) - level.first + 1)
+        if first >= stop:
+            return
+        edges = to_datenum(level.edges(first, stop))
+        fraction = level.fraction(first, stop)
+        for cn in range(fraction.shape[1]):
+            # bar height shows how much of each bin the channel was on
+            self.artists.append(ax.stairs(cn - 0.4 + 0.8 * fraction[:, cn], edges, baseline=cn - 0.4, fill=True,
+                                          color=self.color))
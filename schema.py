@@ -0,0 +1,57 @@
+import re
+
+
+forbidden_keys = frozenset(['event', 'drop_count', 'date', 'time', 'rate', 'nozzle', 'material', 'operator', 'goal',
+                            'other_notes'])
+
+# these often have unique data appended so need to be stripped for use in the UI event list
+shortened_events = ['Triggered camera', 'Starting torture test', 'Aborting torture test', 'Completed cycle',
+                    'Torture test completed']
+
+comment_marker = 'Comment:'
+comment_type = 'Comment'
+
+
+def new_signal_keys(keys, known):
+    # the plottable keys among keys that aren't in known (a set, which is updated), in order
+    new_keys = [key for key in keys if key not in known and key not in forbidden_keys]
+    known.update(new_keys)
+    return new_keys
+
+
+class EventClassifier(object):
+    """maps event strings to the types shown in the event list: comments are moved to the comment list and
+    events with unique data appended are condensed to their prefix. One precompiled pattern finds all of the
+    prefixes in a single pass (where several are in a string the earliest in the list wins, as before), and each
+    distinct string is only classified once."""
+    max_memo = 100000  # distinct strings remembered (camera events are all different)
+
+    def __init__(self, prefixes=shortened_events):
+        markers = [comment_marker] + list(prefixes)
+        self.pattern = re.compile('|'.join(re.escape(marker) for marker in markers))
+        self.priority = {marker: num for num, marker in enumerate(markers)}
+        self.memo = {}  # event -> (type, whether it's a comment)
+
+    def lookup(self, event):
+        result = self.memo.get(event)
+        if result is None:
+            found = self.pattern.findall(event)
+            marker = min(found, key=self.priority.get) if found else None
+            if marker == comment_marker:
+                result = (comment_type, True)
+            else:
+                result = (marker or event, False)
+            if len(self.memo) >= self.max_memo:
+                self.memo.clear()
+            self.memo[event] = result
+        return result
+
+    def classify(self, event):
+        return self.lookup(event)[0]
+
+    def is_comment(self, event):
+        return self.lookup(event)[1]
+
+
+classifier = EventClassifier()
+event_type_of = classifier.classify
@@ -0,0 +1,178 @@
+import os
+import copy
+import numpy as np
+from logmodel import LogModel
+from signalstore import SignalStore
+from eventindex import EventIndex
+from instrument import trace, span
+
+
+def logged_columns(store):
+    # the time and the columns of values from the log (derived signals are calculated into columns too, but only
+    # as far as they've been plotted, so they'd make copies of a row look different)
+    return [store.time[:len(store)]] + [store.column(key) for key in store.columns if key in store.keys]
+
+
+def row_hashes(store):
+    # a 64-bit hash of each row's time, values and event, so the same row can be found in two files
+    hashes = np.zeros(len(store), dtype=np.uint64)
+    for column in logged_columns(store):
+        bits = np.where(np.isnan(column), np.nan, column).view(np.uint64)  # every NaN with the same bits
+        hashes = (hashes * np.uint64(1099511628211)) ^ bits
+    return (hashes * np.uint64(1099511628211)) ^ store.category_column('event').astype(np.uint64)
+
+
+def same_values(store, rows, others):
+    # which rows really are equal to the others, hash aside
+    equal = store.category_column('event')[rows] == store.category_column('event')[others]
+    for column in logged_columns(store):
+        a, b = column[rows], column[others]
+        equal &= (a == b) | (np.isnan(a) & np.isnan(b))
+    return equal
+
+
+def duplicate_rows(store, sources):
+    # rows already in an earlier-added file (sources gives each row's file). A row repeated within one
+    # file is left alone; where several files have it, the copies from the first of them are kept.
+    hashes = row_hashes(store)
+    order = np.lexsort((sources, hashes, store.time[:len(store)]))
+    times, hashes = store.time[order], hashes[order]
+    same = np.concatenate([[False], (times[1:] == times[:-1]) & (hashes[1:] == hashes[:-1])])
+    group_start = np.maximum.accumulate(np.where(same, 0, np.arange(len(order))))  # NaN times are never the same
+    candidates = np.flatnonzero(sources[order] != sources[order][group_start])
+    rows, others = order[candidates], order[group_start[candidates]]
+    return rows[same_values(store, rows, others)]
+
+
+class LogSession(LogModel):
+    """several logs viewed as one. Each file is parsed into a LogModel of its own and log_data is their rows
+    merged in time order, with rows that are in more than one file kept once. Adding or removing a file only
+    re-merges what's already parsed; nothing is read again."""
+    def __init__(self):
+        super().__init__()
+        self.models = {}  # normalized filename -> LogModel, in the order the files were added
+        self.duplicates = 0  # rows left out of log_data because an earlier file had them
+
+    @staticmethod
+    def key(filename):
+        return os.path.normcase(os.path.abspath(filename))
+
+    def __contains__(self, filename):
+        return self.key(filename) in self.models
+
+    def files(self):
+        return [model.tail.filename for model in self.models.values()]
+
+    def add(self, filename, progress=None, cancel=None):
+        # parses one more file (or again, if it's already here); returns its date range as LogModel.load does.
+        # If cancelled the session is left as it was.
+        model = LogModel()
+        date_range = model.load(filename, progress=progress, cancel=cancel)
+        self.models.pop(self.key(filename), None)
+        self.models[self.key(filename)] = model
+        self.merge()
+        return date_range
+
+    def remove(self, filename, progress=None, cancel=None):
+        self.models.pop(self.key(filename), None)
+        self.merge()
+
+    def follow(self, progress=None, cancel=None):
+        # reads whatever was appended to any of the files; one that was replaced is parsed again.
+        # Returns (rows added, whether the key/event/comment lists changed) like LogModel.follow.
+        with trace('follow') as stage:
+            rows_before = len(self.log_data)  # (with one file, log_data is that file's and grows as it's followed)
+            lists_before = (len(self.signal_keys), len(self.event_list), len(self.comment_list))
+            grown = []
+            replaced = False
+            for key, model in list(self.models.items()):
+                start = len(model.log_data)
+                tail = copy.copy(model.tail)
+                result = model.follow()
+                if result is None:
+                    print('%s was replaced, reloading...' % model.tail.filename)
+                    reloaded = LogModel()
+                    try:
+                        reloaded.load(model.tail.filename, progress=progress, cancel=cancel)
+                    except Exception:
+                        model.tail = tail  # the file's old model stays, and the next follow tries again
+                        raise
+                    self.models[key] = reloaded
+                    replaced = True
+                elif result[0]:
+                    grown.append((model, start))
+            if not grown and not replaced:
+                return 0, False
+            if len(self.models) == 1 or replaced or not self.append_merged(grown):
+                self.merge()
+            stage.count(len(self.log_data) - rows_before)
+        return (len(self.log_data) - rows_before, replaced or
+                (len(self.signal_keys), len(self.event_list), len(self.comment_list)) != lists_before)
+
+    def ensure_loaded(self, min_date_time, max_date_time, progress=None, cancel=None):
+        # big logs are read a time window at a time; any that read more mean a new merge
+        loaded = [model.ensure_loaded(min_date_time, max_date_time, progress, cancel)
+                  for model in self.models.values()]
+        if any(loaded):
+            self.merge()
+        return any(loaded)
+
+    def append_merged(self, grown):
+        # the usual auto-update: one file got rows later than anything else, so they just go on the end
+        if len(grown) != 1:
+            return False
+        model, first_new = grown[0]
+        new_times = model.log_data.time[first_new:len(model.log_data)]
+        merged_times = self.log_data.time[:len(self.log_data)]
+        if np.isnan(new_times).any() or not len(merged_times) or new_times.min() <= np.nanmax(merged_times):
+            return False
+        start = len(self.log_data)
+        self.log_data.extend(model.log_data.take(np.arange(first_new, len(model.log_data))))
+        self.index_log_data(start)
+        self.add_derived_keys()
+        return True
+
+    def merge(self):
+        # rebuilds log_data and the lists from the files' models
+        models = list(self.models.values())
+        self.tail = models[-1].tail if models else None
+        self.info = models[0].info if models else None
+        self.start_time = models[0].start_time if models else None  # the first file wins, as before
+        self.duplicates = 0
+        if not models:
+            self.log_data = SignalStore()
+            self.signal_keys = []
+            self.event_list = []
+            self.events = EventIndex()
+            self.comment_list = []
+            return
+        if len(models) == 1:  # nothing to merge, so it's just the model, rows in the order of the file
+            model = models[0]
+            self.log_data = model.log_data
+            self.signal_keys = model.signal_keys
+            self.event_list = model.event_list
+            self.events = model.events
+            self.comment_list = model.comment_list
+            return
+        with span('merge', 'Merging %d files...' % len(models)) as stage:
+            combined = SignalStore()
+            for model in models:
+                combined.extend(model.log_data)
+            sources = np.repeat(np.arange(len(models)), [len(model.log_data) for model in models])
+            keep = np.ones(len(combined), dtype=bool)
+            keep[duplicate_rows(combined, sources)] = False
+            rows = np.flatnonzero(keep)
+            # each file is (nearly always) already in time order, so the stable sort (timsort) just merges those
+            # runs -- the k-way merge, done in numpy rather than with a heap of rows in Python
+            order = rows[np.argsort(combined.time[rows], kind='stable')]
+            self.log_data = combined.take(order)
+            self.duplicates = len(combined) - len(rows)
+            stage.count(len(self.log_data))
+        if self.duplicates:
+            print('%d rows were in more than one file' % self.duplicates)
+        self.signal_keys = []
+        self.event_list = []
+        self.events = EventIndex()
+        self.comment_list = []
+        self.index_log_data()
+        self.add_derived_keys()
@@ -0,0 +1,166 @@
+import numpy as np
+from timeparse import TimeParser
+from timeindex import TimeIndex
+
+
+category_keys = ['event', 'event_type']  # text columns, stored as integer codes into a list of distinct strings
+time_keys = ['date', 'time']  # folded into the time column
+
+
+def grow(array, capacity, fill):
+    new_array = np.full(capacity, fill, dtype=array.dtype)
+    new_array[:len(array)] = array
+    return new_array
+
+
+class SignalStore(object):
+    """columnar copy of a log: a float64 time column (matplotlib date numbers, parsed once on the way in), one float64 array per numeric key (NaN where a row
+    has no value) and integer codes for the event columns (-1 where a row has no event)"""
+    def __init__(self):
+        self.length = 0
+        self.capacity = 0
+        self.time_parser = TimeParser()  # remembers the file's date/time format between appends
+        self._time_index = None  # built on first use, dropped when rows are appended
+        self.time = np.empty(0)
+        self.columns = {}  # key -> float64 buffer, valid up to self.length
+        self.codes = {key: np.empty(0, dtype=np.int32) for key in category_keys}
+        self.categories = {key: [] for key in category_keys}  # code -> string
+        self.category_lookup = {key: {} for key in category_keys}  # string -> code
+        self.keys = {}  # every key seen in the rows, numeric or not, in order of first appearance
+        self.derived = {}  # derived signal -> how many rows of its column have been calculated
+        self.event_types = np.empty(0, dtype=np.int32)  # event code -> event_type code, for the events classified
+        self.comment_codes = []  # and the event codes among those that are comments
+
+    def __len__(self):
+        return self.length
+
+    def reserve(self, length):
+        if length <= self.capacity:
+            return
+        self.capacity = max(length, 2 * self.capacity, 1024)  # amortizes appends from auto-update
+        self.time = grow(self.time, self.capacity, np.nan)
+        for key in self.columns:
+            self.columns[key] = grow(self.columns[key], self.capacity, np.nan)
+        for key in self.codes:
+            self.codes[key] = grow(self.codes[key], self.capacity, -1)
+
+    def buffer(self, key):
+        # the full-capacity array for a numeric key, created (all NaN) the first time it's needed
+        if key not in self.columns:
+            self.columns[key] = np.full(self.capacity, np.nan)
+        return self.columns[key]
+
+    def intern(self, key, text):
+        if not text:
+            return -1
+        lookup = self.category_lookup[key]
+        code = lookup.get(text)
+        if code is None:
+            code = lookup[text] = len(self.categories[key])
+            self.categories[key].append(text)
+        return code
+
+    def append_rows(self, log_data):
+        # log_data is a list of dicts, one per JSON line
+        start = self.length
+        end = start + len(log_data)
+        self.reserve(end)
+        self.time[start:end] = self.time_parser.parse(log_data)
+        for key in category_keys:
+            self.codes[key][start:end] = [self.intern(key, line.get(key)) for line in log_data]
+
+        keys = self.keys
+        new_values = {}  # key -> (row numbers, values)
+        for num, line in enumerate(log_data):
+            for key, value in line.items():
+                if key not in keys:
+                    keys[key] = None
+                if key in category_keys or key in time_keys:
+                    continue
+                if isinstance(value, (int, float)):  # strings (nozzle, operator, etc.) aren't plottable
+                    rows, values = new_values.setdefault(key, ([], []))
+                    rows.append(num)
+                    values.append(value)
+        for key, (rows, values) in new_values.items():
+            self.buffer(key)[start + np.array(rows, dtype=np.intp)] = values
+        self.length = end
+        self._time_index = None
+
+    def extend(self, other):
+        # appends the rows of another store, re-coding its categories into ours
+        start = self.length
+        end = start + other.length
+        self.reserve(end)
+        self.time[start:end] = other.time[:other.length]
+        for key in other.columns:
+            self.buffer(key)[start:end] = other.columns[key][:other.length]
+        for key in category_keys:
+            recode = [self.intern(key, text) for text in other.categories[key]]
+            recode = np.array(recode + [-1], dtype=np.int32)  # so that -1 (no event) stays -1
+            self.codes[key][start:end] = recode[other.codes[key][:other.length]]
+        for key in other.keys:
+            self.keys.setdefault(key)
+        if self.time_parser.formats is None:
+            self.time_parser.formats = other.time_parser.formats
+        self.length = end
+        self._time_index = None
+
+    def take(self, rows):
+        # a new store with just the given rows, in the given order
+        store = SignalStore()
+        store.length = store.capacity = len(rows)
+        store.time_parser.formats = self.time_parser.formats
+        store.time = self.time[rows]
+        store.columns = {key: column[rows] for key, column in self.columns.items()}
+        store.codes = {key: codes[rows] for key, codes in self.codes.items()}
+        store.categories = {key: list(texts) for key, texts in self.categories.items()}
+        store.category_lookup = {key: dict(lookup) for key, lookup in self.category_lookup.items()}
+        store.keys = dict(self.keys)
+        store.event_types = self.event_types
+        store.comment_codes = list(self.comment_codes)
+        return store
+
+    def trim(self):
+        # drops the spare capacity, e.g. before the store is pickled
+        self.capacity = self.length
+        self.time = self.time[:self.length].copy()
+        for key in self.columns:
+            self.columns[key] = self.columns[key][:self.length].copy()
+        for key in self.codes:
+            self.codes[key] = self.codes[key][:self.length].copy()
+
+    def time_index(self):
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.time[:self.length])
+        return self._time_index
+
+    def column(self, key):
+        # a view of the valid part of a numeric column, or None if the key never had a numeric value
+        if key not in self.columns:
+            return None
+        return self.columns[key][:self.length]
+
+    def set_column(self, key, values, start=0):
+        self.buffer(key)[start:self.length] = values
+
+    def value(self, key, row):
+        # a single value as it appeared in the log: None if missing, int if it's a whole number
+        if key in self.codes:
+            return self.category(key, row)
+        column = self.column(key)
+        if column is None or np.isnan(column[row]):
+            return None
+        value = float(column[row])
+        return int(value) if value.is_integer() else value
+
+    def category_column(self, key):
+        return self.codes[key][:self.length]
+
+    def category(self, key, row):
+        code = self.codes[key][row]
+        return self.categories[key][code] if code >= 0 else None
+
+    def category_codes(self, key, texts):
+        # the codes of whichever of the given strings occur in the log
+        lookup = self.category_lookup[key]
+        return np.array([lookup[text] for text in texts if text in lookup], dtype=np.int32)
@@ -0,0 +1,53 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from session import LogSession
+
+
+def write_log(filename, first, count):
+    # 1 Hz rows numbered from first, so two logs with overlapping numbers share those rows exactly
+    start = datetime(2018, 7, 3, 10)
+    with open(filename, 'w') as log_file:
+        for row in range(first, first + count):
+            moment = start + timedelta(seconds=row)
+            log_file.write(json.dumps({'date': moment.strftime('%Y%m%d'), 'time': moment.strftime('%H:%M:%S'),
+                                       'odo': row, 'fdRatio': 1 + row % 7, 'jitter': row % 5}) + '\n')
+
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.first = os.path.join(self.directory, 'first.txt')
+        self.second = os.path.join(self.directory, 'second.txt')
+        write_log(self.first, 0, 1000)
+        write_log(self.second, 500, 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def merged(self, derive_first):
+        session = LogSession()
+        session.add(self.first)
+        if derive_first:
+            session.generate_plot_data(['drop_diam', 'jitter_avg'], datetime(2000, 1, 1), datetime(2100, 1, 1))
+        session.add(self.second)
+        return session
+
+    def test_overlap_is_dropped(self):
+        session = self.merged(False)
+        self.assertEqual(session.duplicates, 500)
+        self.assertEqual(len(session.log_data), 1500)
+
+    def test_overlap_is_dropped_after_deriving(self):
+        # derived columns are only filled in as far as they've been plotted, so they mustn't count
+        session = self.merged(True)
+        self.assertEqual(session.duplicates, 500)
+        self.assertEqual(len(session.log_data), 1500)
+        self.assertIn('drop_diam', session.signal_keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class TimeIndex(object):
+    """sorted view of a time column: binary-search range queries and nearest-sample lookup.
+    Positions returned are always positions in the original column; NaN times are left out."""
+    def __init__(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        valid = ~np.isnan(times)
+        self.positions = None if valid.all() else np.flatnonzero(valid)  # sorted position -> original position
+        self.sorted_times = times if self.positions is None else times[self.positions]
+        self.monotonic = not np.any(np.diff(self.sorted_times) < 0)  # the usual case for a single log
+        if not self.monotonic:
+            order = np.argsort(self.sorted_times, kind='stable')
+            self.sorted_times = self.sorted_times[order]
+            self.positions = order if self.positions is None else self.positions[order]
+
+    def __len__(self):
+        return len(self.sorted_times)
+
+    def position(self, sorted_position):
+        return int(sorted_position if self.positions is None else self.positions[sorted_position])
+
+    def range(self, t_min, t_max):
+        # positions with t_min < time < t_max, in original order
+        lo = np.searchsorted(self.sorted_times, t_min, side='right')
+        hi = max(lo, np.searchsorted(self.sorted_times, t_max, side='left'))
+        if self.positions is None:
+            return np.arange(lo, hi)
+        positions = self.positions[lo:hi]
+        return positions if self.monotonic else np.sort(positions)
+
+    def nearest(self, t):
+        # position of the sample closest in time to t, or None if there are no samples
+        count = len(self.sorted_times)
+        if not count:
+            return None
+        i = int(np.searchsorted(self.sorted_times, t))
+        if i == count or (i > 0 and t - self.sorted_times[i - 1] <= self.sorted_times[i] - t):
+            i -= 1
+        return self.position(i)
@@ -0,0 +1,90 @@
+from datetime import datetime
+import numpy as np
+
+
+# the formats the logger has used over the years; the 24-hour ones come first because they're the most common
+date_formats = ['%Y%m%d', '%m/%d/%Y']
+time_formats = ['%H:%M:%S', '%I:%M:%S %p']
+
+
+def detect_format(date, time):
+    # returns the (date format, time format) couple that parses this row, or None
+    for date_format in date_formats:
+        for time_format in time_formats:
+            try:
+                datetime.strptime(f'{date} {time}', f'{date_format} {time_format}')
+            except ValueError:
+                continue
+            return date_format, time_format
+    return None
+
+
+def parse_fixed_width(times, twelve_hour=False):
+    # vectorized parse of zero-padded 'HH:MM:SS' (or 'HH:MM:SS AM') strings to seconds since midnight
+    # returns the seconds and a mask of which strings actually had that shape
+    width = 11 if twelve_hour else 8
+    chars = np.array(times, dtype=f'S{width + 1}').view(np.uint8).reshape(-1, width + 1).astype(np.int32)
+    digits = chars[:, [0, 1, 3, 4, 6, 7]] - ord('0')
+    ok = ((chars[:, width] == 0) & (chars[:, 2] == ord(':')) & (chars[:, 5] == ord(':')) &
+          np.all((digits >= 0) & (digits <= 9), axis=1))
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    if twelve_hour:
+        ampm = chars[:, 9] | 0x20  # lower case
+        ok &= (chars[:, 8] == ord(' ')) & ((ampm == ord('a')) | (ampm == ord('p'))) & ((chars[:, 10] | 0x20) == ord('m'))
+        ok &= (hours >= 1) & (hours <= 12)
+        hours = hours % 12 + np.where(ampm == ord('p'), 12, 0)
+    seconds = hours * 3600 + (digits[:, 2] * 10 + digits[:, 3]) * 60 + digits[:, 4] * 10 + digits[:, 5]
+    return seconds.astype(np.float64), ok
+
+
+class TimeParser(object):
+    """turns the date/time strings of a file's rows into matplotlib date numbers.
+    The format is detected from the first row, and each distinct date is only parsed once."""
+    def __init__(self):
+        self.formats = None  # (date format, time format) couple
+        self.day_numbers = {}  # date string -> date number of its midnight
+
+    def day_number(self, date):
+        day = self.day_numbers.get(date)
+        if day is None:
+            import matplotlib.dates  # (not at the top, so the viewer's window isn't kept waiting for matplotlib)
+            formats = [self.formats[0]] + [f for f in date_formats if f != self.formats[0]]
+            for date_format in formats:
+                try:
+                    day = matplotlib.dates.date2num(datetime.strptime(date, date_format))
+                except ValueError:
+                    continue
+                break
+            else:
+                day = np.nan
+            self.day_numbers[date] = day
+        return day
+
+    def parse_one(self, date, time):
+        # slow path for rows that don't match the detected format (e.g. a logger that switched to AM/PM)
+        formats = detect_format(date, time)
+        if formats is None:
+            return np.nan
+        date_time = datetime.strptime(f'{date} {time}', f'{formats[0]} {formats[1]}')
+        import matplotlib.dates
+        return matplotlib.dates.date2num(date_time)
+
+    def parse(self, log_data):
+        # returns a float64 array with one date number per row (NaN for rows without a date and time)
+        times = np.full(len(log_data), np.nan)
+        rows = [num for num, line in enumerate(log_data) if 'date' in line and 'time' in line]
+        if not rows:
+            return times
+        dates = [log_data[num]['date'] for num in rows]
+        time_strings = [log_data[num]['time'] for num in rows]
+        if self.formats is None:
+            self.formats = detect_format(dates[0], time_strings[0]) or (date_formats[0], time_formats[0])
+
+        days = np.array([self.day_number(date) for date in dates])
+        seconds, ok = parse_fixed_width(time_strings, twelve_hour=self.formats[1] == time_formats[1])
+        ok &= ~np.isnan(days)
+        row_times = days + seconds / 86400
+        for num in np.flatnonzero(~ok):
+            row_times[num] = self.parse_one(dates[num], time_strings[num])
+        times[rows] = row_times
+        return times
@@ -0,0 +1,33 @@
+import threading
+import traceback
+from PyQt5.QtCore import QThread, pyqtSignal
+from ingest import Cancelled
+
+
+class Worker(QThread):
+    """runs func(*args, progress=..., cancel=...) off the GUI thread.
+    The QThread object itself lives on the GUI thread, so its signals are delivered there."""
+    progress = pyqtSignal(object, object, object)  # bytes parsed, bytes to parse, rows so far (a C int stops at 2 GB)
+    done = pyqtSignal(object)  # whatever func returned
+    failed = pyqtSignal(str)  # the traceback
+
+    def __init__(self, func, *args):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.cancel = threading.Event()
+
+    def run(self):
+        try:
+            result = self.func(*self.args, progress=self.progress.emit, cancel=self.cancel)
+        except Cancelled:
+            return
+        except Exception:
+            self.failed.emit(traceback.format_exc())
+            return
+        self.done.emit(result)
+
+    def stop(self):
+        # asks func to give up at its next check and waits until it has
+        self.cancel.set()
+        self.wait()